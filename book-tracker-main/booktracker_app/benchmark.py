@@ -0,0 +1,515 @@
+# Benchmark suite for BookCollection and the Tk screens on synthetic libraries.
+# Why: Measures how load/save/add/delete, the "Add to Wishlist" duplicate check and the list and
+# background rendering scale from 1k to 1M books, and fails loudly when a change makes any of them
+# slower or hungrier than the stored baseline.
+#
+#   python benchmark.py                          # all sizes, compare with benchmark_baseline.json
+#   python benchmark.py --sizes 1000,10000 --storage sqlite --output results.json
+#   python benchmark.py --update-baseline        # store this run as the new baseline
+#   python benchmark.py --add-to-baseline        # ...then fold in a few more runs of the same code
+#
+# The GUI benchmarks need a display. Without $DISPLAY an Xvfb server is started for the run if
+# one is installed; otherwise they are skipped, and listed as not compared against the baseline.
+# A baseline must measure every benchmark (record it where Xvfb or a display is available): a
+# benchmark the baseline skipped fails the run rather than going unchecked.
+
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import main as app
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+BACKGROUND_IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "teeee.jpg")
+
+# STUDENT ID the GUI benchmarks log in as.
+BENCH_STUDENT = "benchmark"
+
+# Operations timed per run by the add/delete/duplicate-check benchmarks.
+ADD_OPS = 200
+DELETE_OPS = 200
+DUPLICATE_CHECK_OPS = 1000
+VISIBLE_ROWS = 20  # Rows a list screen shows at the default window size
+
+# A change only counts as a regression if it is also bigger than these absolute amounts.
+# Why: Keeps timer and allocator noise on the sub-millisecond benchmarks from failing the run.
+MIN_SECONDS_DELTA = 0.005
+MIN_PEAK_BYTES_DELTA = 1024 * 1024
+# ...and bigger than this many times the spread (median distance of a run from the median) either
+# side measured. Times are compared with the slowest of the baseline's sessions (see
+# merge_baseline()), not its median.
+# Why: A fixed percentage failed unchanged code on benchmarks whose run times vary more than that,
+# within one run or from one run of the suite to the next.
+NOISE_SPREADS = 3
+
+# Write a books.json with size books (90% in My Books, 10% in the Wishlist).
+# Why: Writing the snapshot directly is much faster than adding a million books one at a time.
+def write_library(path, size):
+    statuses = app.BOOK_STATUSES
+    wishlist_size = size // 10
+    with open(path, "w") as file:
+        file.write('{"my_books": [')
+        for i in range(size):
+            if i == size - wishlist_size:
+                file.write('], "wishlist": [')
+            elif i:
+                file.write(", ")
+            book = {"id": i + 1, "title": f"Synthetic Title {i}", "author": f"Author {i % 5000}"}
+            if i < size - wishlist_size:
+                book["status"] = statuses[i % len(statuses)]
+            file.write(json.dumps(book))
+        if not wishlist_size:
+            file.write('], "wishlist": [')
+        file.write(f'], "seq": 0, "next_id": {size + 1}}}')
+
+# Synthetic libraries for one size, copied fresh into a scratch directory for every run.
+class Library:
+    def __init__(self, directory, size, storage):
+        self.size = size
+        self.storage = storage
+        self._template = os.path.join(directory, f"template-{size}")
+        os.makedirs(self._template, exist_ok=True)
+        json_path = os.path.join(self._template, "books.json")
+        if not os.path.exists(json_path):
+            write_library(json_path, size)
+        if storage == "sqlite" and not os.path.exists(os.path.join(self._template, "books.db")):
+            app.migrate_json_to_sqlite(json_path, os.path.join(self._template, "books.db"))
+        self._scratch = os.path.join(directory, "run")
+
+    # Copy the library into an empty scratch directory and return that directory.
+    def fresh_copy(self):
+        shutil.rmtree(self._scratch, ignore_errors=True)
+        os.makedirs(self._scratch)
+        name = "books.db" if self.storage == "sqlite" else "books.json"
+        shutil.copy(os.path.join(self._template, name), os.path.join(self._scratch, name))
+        return self._scratch
+
+    # Open a fresh copy the way the app does (journal mode for JSON, duplicate rejection on).
+    def open(self):
+        directory = self.fresh_copy()
+        return app.open_collection(self.storage, os.path.join(directory, "books.json"), os.path.join(directory, "books.db"))
+
+@contextlib.contextmanager
+def _timing(result):
+    gc.collect()
+    start = time.perf_counter()
+    yield
+    result["seconds"] = time.perf_counter() - start
+
+@contextlib.contextmanager
+def _tracing(result):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        yield
+    finally:
+        result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+def bench_load_data(library, measure):
+    collection = library.open()
+    try:
+        with measure:
+            collection.load_data()
+    finally:
+        collection.close()
+
+def bench_save_data(library, measure):
+    collection = library.open()
+    try:
+        with measure:
+            collection.save_data()
+    finally:
+        collection.close()
+
+def bench_add_book(library, measure):
+    collection = library.open()
+    try:
+        with measure:
+            for i in range(ADD_OPS):
+                collection.add_book("my_books", {"title": f"New Title {i}", "author": "New Author"})
+    finally:
+        collection.close()
+
+# Adds and status changes while My Books is shown sorted by title: each change has to keep the
+# sorted index in order, and the list then reads its first screenful from it.
+def bench_sorted_view_changes(library, measure):
+    collection = library.open()
+    try:
+        books = collection.books("my_books", "title")
+        len(books)  # Sort once, outside the measurement
+        with measure:
+            for i in range(ADD_OPS):
+                collection.add_book("my_books", {"title": f"New Title {i}", "author": "New Author"})
+                collection.update_status(books[i % len(books)].id, "Reading")
+                books[:20]
+    finally:
+        collection.close()
+
+def bench_delete_book(library, measure):
+    collection = library.open()
+    positions = random.Random(library.size)
+    try:
+        with measure:
+            for _ in range(DELETE_OPS):
+                count = len(collection.my_books)
+                if not count:
+                    break
+                collection.delete_book("my_books", positions.randrange(count))
+    finally:
+        collection.close()
+
+# Deleting by id, as the list screens do, for comparison with the positional delete_book.
+# After each delete a screenful of rows is read from the middle of the list, as the list screen
+# does when it redraws, so the cost of paging after a removal is measured too.
+def bench_delete_by_id(library, measure):
+    collection = library.open()
+    picks = random.Random(library.size)
+    try:
+        books = collection.my_books
+        ids = list({books[picks.randrange(len(books))].id for _ in range(DELETE_OPS)}) if books else []
+        with measure:
+            for book_id in ids:
+                collection.delete(book_id)
+                middle = len(books) // 2
+                books[middle:middle + VISIBLE_ROWS]
+    finally:
+        collection.close()
+
+# The check "Add to Wishlist" makes before adding: is this title/author already in the Wishlist?
+def bench_wishlist_duplicate_check(library, measure):
+    collection = library.open()
+    titles = random.Random(library.size)
+    try:
+        books = collection.my_books
+        picks = [books[titles.randrange(len(books))] for _ in range(DUPLICATE_CHECK_OPS)] if books else []
+        with measure:
+            for book in picks:
+                collection.contains("wishlist", book["title"], book["author"])
+    finally:
+        collection.close()
+
+# Build the app inside an already created Tk root and log in as a student whose shard is a fresh
+# copy of the library.
+def _open_app(library, root):
+    directory = library.fresh_copy()
+    shutil.copy(BACKGROUND_IMAGE, os.path.join(directory, "teeee.jpg"))
+    shard_root = os.path.join(directory, app.SHARD_ROOT)
+    shard = app.student_shard_dir(BENCH_STUDENT, shard_root)
+    os.makedirs(shard)
+    for name in os.listdir(directory):
+        if name.startswith("books."):
+            os.replace(os.path.join(directory, name), os.path.join(shard, name))
+    os.chdir(directory)
+    app.messagebox.showinfo = lambda *args, **kwargs: "ok"  # The "Welcome!" dialog would wait for a click
+    root.geometry("800x600")
+    book_tracker = app.BookTrackerApp(root, storage=library.storage, shard_root=shard_root)
+    book_tracker.log_in(BENCH_STUDENT)
+    _wait_for(root, lambda: book_tracker.screens.current == "home", "the login")
+    return book_tracker
+
+def _close_app(book_tracker, root):
+    book_tracker.logout()
+    if hasattr(book_tracker, "bg_renderer"):
+        book_tracker.bg_renderer.close()
+    root.destroy()
+
+# First visit to the My Books screen (building it) until Tk has drawn it.
+def bench_view_books_gui(library, measure):
+    root = app.tk.Tk()
+    book_tracker = _open_app(library, root)
+    try:
+        with measure:
+            book_tracker.view_books_gui("my_books")
+            root.update()
+    finally:
+        _close_app(book_tracker, root)
+
+# Run the Tk loop until condition() is true.
+def _wait_for(root, condition, what, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise RuntimeError(f"timed out waiting for {what}")
+        root.update()
+        time.sleep(0.001)
+
+# Re-rendering the background for a window size that isn't cached yet, until the full-quality
+# image is on screen.
+def bench_resize_bg_image(library, measure):
+    root = app.tk.Tk()
+    book_tracker = _open_app(library, root)
+    try:
+        if not hasattr(book_tracker, "bg_renderer"):
+            raise RuntimeError("background image could not be loaded")
+        _wait_for(root, lambda: book_tracker.bg_photo is not None, "the first background")
+        root.geometry("1024x700")
+        root.update()
+        # Drop the resize timers the new geometry scheduled, so only the call below does any work
+        for attribute in ("_preview_after_id", "_resize_after_id"):
+            if getattr(book_tracker, attribute):
+                root.after_cancel(getattr(book_tracker, attribute))
+                setattr(book_tracker, attribute, None)
+        size = book_tracker._window_size()
+        renderer = book_tracker.bg_renderer
+        with measure:
+            book_tracker._resize_bg_image()
+            _wait_for(root, lambda: book_tracker.bg_photo is not None and book_tracker.bg_photo is renderer.get(size),
+                      f"the background at {size}")
+    finally:
+        _close_app(book_tracker, root)
+
+BENCHMARKS = [
+    ("load_data", bench_load_data, False),
+    ("save_data", bench_save_data, False),
+    ("add_book", bench_add_book, False),
+    ("delete_book", bench_delete_book, False),
+    ("delete_by_id", bench_delete_by_id, False),
+    ("wishlist_duplicate_check", bench_wishlist_duplicate_check, False),
+    ("sorted_view_changes", bench_sorted_view_changes, False),
+    ("view_books_gui", bench_view_books_gui, True),
+    ("resize_bg_image", bench_resize_bg_image, True),
+]
+
+# Run one benchmark: median wall time of `repeat` runs and their spread, and peak traced memory
+# of one more run. Given an earlier result, its run times are pooled with the new ones.
+# Why: The median (unlike the fastest run) doesn't hinge on one lucky run, and the spread tells
+# compare() how much the time moves without any change; both ignore a single outlier, such as a
+# run that happened to trigger a compaction. Memory is traced in a separate run because
+# tracemalloc slows the code it watches.
+def run_benchmark(name, function, library, repeat, previous=None):
+    result = {"name": name, "storage": library.storage, "size": library.size}
+    cwd = os.getcwd()
+    try:
+        times = list(previous["times"]) if previous else []
+        for _ in range(repeat):
+            timing = {}
+            function(library, _timing(timing))
+            times.append(timing["seconds"])
+        result["times"] = times
+        result["seconds"] = statistics.median(times)
+        result["spread"] = statistics.median(abs(seconds - result["seconds"]) for seconds in times)
+        function(library, _tracing(result))
+    except Exception as e:
+        result = {"name": name, "storage": library.storage, "size": library.size, "error": f"{type(e).__name__}: {e}"}
+    finally:
+        os.chdir(cwd)
+    return result
+
+# Make sure there is an X display for the GUI benchmarks, starting Xvfb if needed.
+# Yields True if a display is available.
+@contextlib.contextmanager
+def headless_display():
+    if os.environ.get("DISPLAY"):
+        yield True
+        return
+    xvfb = shutil.which("Xvfb")
+    if xvfb is None:
+        yield False
+        return
+    number = 99
+    while os.path.exists(f"/tmp/.X11-unix/X{number}") or os.path.exists(f"/tmp/.X{number}-lock"):
+        number += 1
+    server = subprocess.Popen([xvfb, f":{number}", "-screen", "0", "1280x800x24", "-nolisten", "tcp"],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 10
+        while not os.path.exists(f"/tmp/.X11-unix/X{number}"):
+            if server.poll() is not None or time.monotonic() > deadline:
+                yield False
+                return
+            time.sleep(0.05)
+        os.environ["DISPLAY"] = f":{number}"
+        try:
+            yield True
+        finally:
+            del os.environ["DISPLAY"]
+    finally:
+        server.terminate()
+        server.wait()
+
+# Compare results with the baseline. Returns (regressions, unmeasured, not_compared): messages for
+# results that got slower or use more memory than the baseline by more than `tolerance` (a
+# fraction, e.g. 0.25 for 25%) and than the noise limits above, for benchmarks the baseline has no
+# measurement of although it measured others on the same library (skipped, failed or left out),
+# and for results that could not be compared otherwise (a library size or storage the baseline
+# doesn't cover, or skipped or failed in this run).
+def compare(results, baseline, tolerance):
+    previous = {(r["name"], r["storage"], r["size"]): r for r in baseline.get("results", [])}
+    libraries = {(r["storage"], r["size"]) for r in baseline.get("results", []) if "seconds" in r}
+    regressions = []
+    unmeasured = []
+    not_compared = []
+    for result in results:
+        label = f"{result['name']} [{result['storage']}, {result['size']} books]"
+        before = previous.get((result["name"], result["storage"], result["size"]))
+        if before is None or "seconds" not in before:
+            reason = "not in the baseline" if before is None else f"baseline has no measurement ({before.get('skipped') or before.get('error')})"
+            if (result["storage"], result["size"]) in libraries:
+                unmeasured.append(f"{label}: {reason}")
+            else:
+                not_compared.append(f"{label}: {reason}")
+            continue
+        if "seconds" not in result:
+            if "skipped" in result:  # Failures are reported separately
+                not_compared.append(f"{label}: skipped ({result['skipped']})")
+            continue
+        slowest = max(before.get("sessions", [before["seconds"]]))
+        noise = NOISE_SPREADS * max(result.get("spread", 0), before.get("spread", 0))
+        if result["seconds"] - slowest > max(before["seconds"] * tolerance, MIN_SECONDS_DELTA, noise):
+            regressions.append(f"{label}: {result['seconds'] * 1000:.1f} ms, baseline {before['seconds'] * 1000:.1f} ms"
+                               f" (slowest baseline run {slowest * 1000:.1f} ms)")
+        if (result["peak_bytes"] > before["peak_bytes"] * (1 + tolerance)
+                and result["peak_bytes"] - before["peak_bytes"] > MIN_PEAK_BYTES_DELTA):
+            regressions.append(f"{label}: peak {result['peak_bytes'] / 1e6:.1f} MB, baseline {before['peak_bytes'] / 1e6:.1f} MB")
+    return regressions, unmeasured, not_compared
+
+# Fold another run of the same code into the baseline. Each result keeps the median of every run
+# (its sessions), and its time becomes the median of those.
+# Why: How fast the suite runs drifts between runs more than within one (machine load, disk
+# caches), and a baseline taken over several runs measures that drift instead of guessing it.
+def merge_baseline(baseline, results):
+    merged = {(r["name"], r["storage"], r["size"]): r for r in baseline.get("results", [])}
+    for result in results:
+        key = (result["name"], result["storage"], result["size"])
+        before = merged.get(key)
+        if before is None or "seconds" not in before:
+            merged[key] = result
+        elif "seconds" in result:
+            sessions = before.get("sessions", [before["seconds"]]) + [result["seconds"]]
+            merged[key] = dict(result, sessions=sessions, seconds=statistics.median(sessions),
+                               spread=max(before.get("spread", 0), result["spread"]),
+                               peak_bytes=max(before["peak_bytes"], result["peak_bytes"]))
+    return dict(baseline, results=list(merged.values()))
+
+def _print_result(result, note=""):
+    label = f"{result['name']:<26} {result['storage']:<6} {result['size']:>8}"
+    if "error" in result:
+        print(f"{label}  ERROR {result['error']}")
+    elif "skipped" in result:
+        print(f"{label}  skipped ({result['skipped']})")
+    else:
+        print(f"{label}  {result['seconds'] * 1000:10.1f} ms +/-{result['spread'] * 1000:7.1f}  peak {result['peak_bytes'] / 1e6:8.1f} MB"
+              + (f"  {note}" if note else ""))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the book tracker on synthetic libraries")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES), help="comma-separated library sizes")
+    parser.add_argument("--storage", choices=["json", "sqlite"], action="append", help="backend(s) to benchmark (default: json)")
+    parser.add_argument("--only", action="append", metavar="NAME", help="run only this benchmark (repeatable)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark; the median is kept")
+    parser.add_argument("--no-gui", action="store_true", help="skip the Tk benchmarks")
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the results")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown/growth before failing (0.25 = 25%%)")
+    parser.add_argument("--recheck", type=int, default=2, help="times to re-run a benchmark that looks regressed before reporting it")
+    parser.add_argument("--update-baseline", action="store_true", help="save this run as the baseline instead of comparing")
+    parser.add_argument("--add-to-baseline", action="store_true",
+                        help="fold this run into the baseline (another run of the same code) instead of comparing")
+    parser.add_argument("--workdir", help="directory for the synthetic libraries (default: a temporary one)")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if not args.update_baseline:
+        try:
+            with open(args.baseline) as file:
+                baseline = json.load(file)
+        except FileNotFoundError:
+            print(f"No baseline at {args.baseline}; run with --update-baseline to create one.")
+    # The noise limits only hold for medians of at least as many runs as the baseline's.
+    # Why: The median of 3 runs of a ~25 ms fsync-bound benchmark drifted past all of them on
+    # unchanged code, so a smaller --repeat is refused rather than compared.
+    if baseline is not None and args.repeat < baseline.get("repeat", 0):
+        parser.error(f"the baseline was recorded with --repeat {baseline['repeat']}; its noise limits don't hold"
+                     f" for fewer runs, so use --repeat {baseline['repeat']} or more")
+    if args.update_baseline and args.no_gui:
+        parser.error("a baseline must include the GUI benchmarks; record it with a display or Xvfb")
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    benchmarks = [b for b in BENCHMARKS if not args.only or b[0] in args.only]
+    workdir = args.workdir or tempfile.mkdtemp(prefix="booktracker-bench-")
+    results = []
+    try:
+        with headless_display() if not args.no_gui else contextlib.nullcontext(False) as has_display:
+            for storage in args.storage or ["json"]:
+                for size in sizes:
+                    library = Library(os.path.join(workdir, storage), size, storage)
+                    for name, function, needs_display in benchmarks:
+                        if needs_display and not has_display:
+                            result = {"name": name, "storage": storage, "size": size,
+                                      "skipped": "--no-gui" if args.no_gui else "no display and no Xvfb"}
+                        else:
+                            result = run_benchmark(name, function, library, args.repeat)
+                            # A slowdown must survive more runs before it counts
+                            # Why: Other load on the machine can slow every run of one benchmark for a while
+                            for _ in range(args.recheck):
+                                if (baseline is None or args.add_to_baseline or "error" in result
+                                        or not compare([result], baseline, args.tolerance)[0]):
+                                    break
+                                _print_result(result, "looks regressed, re-running")
+                                result = run_benchmark(name, function, library, args.repeat, result)
+                        _print_result(result)
+                        results.append(result)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        skipped = [r["name"] for r in results if "skipped" in r]
+        if skipped:
+            print(f"Baseline not updated: {', '.join(sorted(set(skipped)))} could not run here"
+                  " (no display and no Xvfb)", file=sys.stderr)
+            return 1
+        shutil.copy(args.output, args.baseline)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+    if baseline is None:
+        return 0
+    if args.add_to_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(merge_baseline(baseline, results), file, indent=2)
+        print(f"Run added to the baseline: {args.baseline}")
+        return 0
+    regressions, unmeasured, not_compared = compare(results, baseline, args.tolerance)
+    failures = [r for r in results if "error" in r]
+    for message in not_compared:
+        print(f"NOT COMPARED {message}", file=sys.stderr)
+    for message in unmeasured:
+        print(f"NO BASELINE {message}", file=sys.stderr)
+    for message in regressions:
+        print(f"REGRESSION {message}", file=sys.stderr)
+    for result in failures:
+        print(f"FAILED {result['name']} [{result['storage']}, {result['size']} books]: {result['error']}", file=sys.stderr)
+    if regressions or unmeasured or failures:
+        print(f"{len(regressions)} regression(s), {len(unmeasured)} benchmark(s) missing from the baseline,"
+              f" {len(failures)} failure(s) against {args.baseline}", file=sys.stderr)
+        return 1
+    print(f"No regressions against {args.baseline}"
+          + (f" ({len(not_compared)} result(s) not compared)" if not_compared else ""))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,24 @@
+import time
+_PROCESS_STARTED = time.perf_counter()  # Reference point for StartupTimer
+
 import tkinter as tk
-from tkinter import messagebox
+from tkinter import messagebox, filedialog, ttk
+import argparse
+import array
+import bisect
+import collections
+import contextlib
+import csv
+import hashlib
+import itertools
 import json
-from PIL import Image, ImageTk
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+# PIL is imported where it is used, so it doesn't slow down the first paint of the login screen
 
 # Show the login screen window and handle login logic.
 # Why: This function is the entry point for user authentication, ensuring only logged-in users can access the main app.
@@ -12,10 +29,14 @@ def show_login_screen():
 
     # Validate login credentials (accepts any input).
     # Why: For demonstration or testing purposes, any credentials are accepted to simplify access.
+    # The STUDENT ID picks whose books the main app opens.
     def validate_login():
-        messagebox.showinfo("Login Successful", "Welcome!")
+        student_id = username_entry.get().strip()
+        if not student_id:
+            messagebox.showerror("Error", "Please enter your STUDENT ID.")
+            return
         login_window.destroy()
-        launch_main_app()
+        launch_main_app(student_id)
 
     # Exit the application from the login screen.
     # Why: Allows the user to close the app directly from the login menu.
@@ -42,148 +63,2933 @@ def show_login_screen():
 
 # Launch the main Book Tracker application window.
 # Why: This function is called after a successful login to start the main app interface.
-def launch_main_app():
+def launch_main_app(student_id=None):
     root = tk.Tk()
     root.configure(bg="#FF5733")
     app = BookTrackerApp(root)
+    if student_id:
+        app.log_in(student_id)
     root.mainloop()
+    if app.collection is not None:
+        app.collection.close()  # In case the loop was left through root.quit without exit_app
 
 # Class to manage the book collection and wishlist, including saving/loading from file.
 # Why: Encapsulates all book data and file operations, keeping data management separate from the UI logic.
+# Storage itself is delegated to a backend (JsonFileBackend by default, or SqliteBackend), so the UI
+# never needs to know where the books live.
 class BookCollection:
     # Initialize the BookCollection, loading data from file.
     # Why: Loads existing data if available, so user data persists between sessions.
-    def __init__(self, filename="books.json"):
-        self._filename = filename
-        self._my_books = []
-        self._wishlist = []
-        self.load_data()
+    # The filename/journal/compact_threshold arguments configure the default JSON backend;
+    # pass backend= to use a different storage backend instead. With reject_duplicates=True,
+    # add_book refuses a book whose title and author are already in the target collection.
+    # With write_behind=True changes are written by a background WriteBehindQueue (every
+    # flush_interval seconds or after flush_after changes); on_error(exception) is called from
+    # that thread if a write fails. With search=True a SearchIndex over titles and authors is kept
+    # up to date; search_index_path lets it be saved on close and reused on the next start.
+    # With background_load=True the data is loaded on a separate thread; every other method waits
+    # for it to finish, and is_loaded()/wait_until_loaded() let the UI avoid blocking on it.
+    # With stats=True the LibraryStats behind stats() are counted as part of loading instead of on
+    # first use, and with sort_indexes=True the same goes for the SortedBookIndexes behind books()
+    # (a backend with sorted_pages, like SQLite, sorts in its queries and needs none).
+    def __init__(self, filename="books.json", journal=False, compact_threshold=1024 * 1024, backend=None, reject_duplicates=False,
+                 write_behind=False, flush_interval=1.0, flush_after=50, on_error=None, search=False, search_index_path=None,
+                 background_load=False, stats=False, sort_indexes=False):
+        if backend is None:
+            backend = JsonFileBackend(filename, journal=journal, compact_threshold=compact_threshold)
+        self._backend = backend
+        self._reject_duplicates = reject_duplicates
+        self._listeners = []
+        self._writer = None
+        self._search = search
+        self._search_index_path = search_index_path
+        self._search_index = None
+        self._search_index_dirty = False  # True when the index differs from the saved copy
+        self._count_stats = stats
+        self._stats = None  # LibraryStats, once counted
+        self._sort_indexes = sort_indexes
+        self._sorted = {}  # (collection, order) -> SortedBookIndex, built while loading or on first use
+        self._write_behind = (flush_interval, flush_after, on_error) if write_behind else None
+        self._loader = None
+        self._load_error = None
+        if background_load:
+            self._loader = threading.Thread(target=self._load_in_background, daemon=True)
+            self._loader.start()
+        else:
+            self.load_data()
+            self._start_writer()
+
+    # True once the data is in memory (always True without background_load).
+    def is_loaded(self):
+        return self._loader is None or not self._loader.is_alive()
+
+    # Block until a background load has finished, then announce the data to listeners.
+    # Why: Listeners touch Tk widgets, so the "reload" event is sent from the caller's thread
+    # (the Tk thread) rather than from the loader. Re-raises any error the loader hit.
+    def wait_until_loaded(self):
+        loader = self._loader
+        if loader is None:
+            return
+        loader.join()
+        self._loader = None
+        if self._load_error is not None:
+            raise self._load_error
+        self._start_writer()
+        self._notify("reload", None, None, None)
+
+    def _load_in_background(self):
+        try:
+            with instrumentation.span("storage.load"):
+                self._backend.load()
+            if self._search:
+                self._load_search_index()
+            if self._count_stats:
+                self._stats = self._count_books()
+            self._sorted = self._build_sorted_indexes()
+        except Exception as e:
+            self._load_error = e
+
+    def _start_writer(self):
+        if self._write_behind is not None and self._writer is None:
+            self._backend.deferred = True
+            self._writer = WriteBehindQueue(self._backend, *self._write_behind)
 
     @property #<-- keeps the underlying data private
     # Return the list of books in 'My Books'.
     # Why: Provides read-only access to the book list, enforcing encapsulation.
     def my_books(self):
-        return self._my_books
+        self.wait_until_loaded()
+        return BookListView(self._backend, "my_books")
 
     @property
     # Return the list of books in the wishlist.
     # Why: Provides read-only access to the wishlist, enforcing encapsulation.
     def wishlist(self):
-        return self._wishlist
+        self.wait_until_loaded()
+        return BookListView(self._backend, "wishlist")
 
-    # Save the current book data to the JSON file.
+    # Save the current book data to storage.
     # Why: Ensures all changes to books and wishlist are persisted for future sessions.
     def save_data(self):
-        with open(self._filename, "w") as file:
-            json.dump({"my_books": self._my_books, "wishlist": self._wishlist}, file)
+        self.wait_until_loaded()
+        with instrumentation.span("storage.save"):
+            self._backend.save()
 
-    # Load book data from the JSON file.
+    # Load book data from storage.
     # Why: Loads saved data so the user doesn't lose their books or wishlist when restarting the app.
+    # Changes still queued for writing are written first, so the reload includes them.
     def load_data(self):
-        try:
-            with open(self._filename, "r") as file:
-                data = json.load(file)
-                self._my_books = data.get("my_books", [])
-                self._wishlist = data.get("wishlist", [])
-        except FileNotFoundError:
-            pass
+        self.wait_until_loaded()
+        self.flush()
+        with instrumentation.span("storage.load"):
+            self._backend.load()
+        if self._search:
+            self._load_search_index()
+        self._stats = self._count_books() if self._count_stats else None
+        self._sorted = self._build_sorted_indexes()
+        self._notify("reload", None, None, None)
 
     # Add a book to either 'My Books' or 'Wishlist'.
     # Why: Centralizes logic for adding books, so both UI and other code can use the same method.
+    # book is a {"title", "author"} dict (or a Book); a new Book is stored. Returns False (and adds
+    # nothing) when duplicates are rejected and the book is already there.
     def add_book(self, collection, book):
-        if collection == "my_books":
-            book["status"] = "To Read"
-            self._my_books.append(book)
-        elif collection == "wishlist":
-            self._wishlist.append(book)
-        self.save_data()
+        self.wait_until_loaded()
+        if self._reject_duplicates and self.contains(collection, book["title"], book["author"]):
+            return False
+        book = Book(book["title"], book["author"], "To Read" if collection == "my_books" else book.get("status"))
+        with instrumentation.span("storage.add"):
+            self._backend.add(collection, book)
+        self._index_books("add", collection, [(book, book.status)])
+        self._changed()
+        self._notify("insert", collection, self._backend.count(collection) - 1, book)
+        return True
+
+    # Add many books to one collection with a single persist at the end.
+    # Why: Bulk imports would otherwise pay for one write (and one UI notification) per book.
+    # Books keep their own status if they have one; 'My Books' defaults to "To Read".
+    # Returns the number of books added (duplicates are skipped when reject_duplicates is on).
+    def add_books(self, collection, books):
+        self.wait_until_loaded()
+        added = []
+        with self.batch(), instrumentation.span("storage.add_books"):
+            for book in books:
+                if self._reject_duplicates and self.contains(collection, book["title"], book["author"]):
+                    continue
+                status = book.get("status")
+                if status is None and collection == "my_books":
+                    status = "To Read"
+                book = Book(book["title"], book["author"], status)
+                self._backend.add(collection, book)
+                added.append((book, status))
+        self._index_books("add", collection, added)
+        if added:
+            self._changed()
+            self._notify("reload", collection, None, None)
+        return len(added)
 
     # Delete a book from either 'My Books' or 'Wishlist' by index.
     # Why: Allows removal of books from either collection, keeping the UI and data in sync.
+    # Positions shift as books come and go; prefer delete(book_id) where the id is known.
     def delete_book(self, collection, index):
-        if collection == "my_books":
-            self._my_books.pop(index)
+        self.wait_until_loaded()
+        books = self._backend.page(collection, index, 1) if index >= 0 else []
+        if not books:
+            raise IndexError("book index out of range")
+        self.delete(books[0].id)
+
+    # Return the book with this id, or None.
+    def get(self, book_id):
+        self.wait_until_loaded()
+        found = self._backend.get(book_id)
+        return found[1] if found else None
+
+    # Delete a book by id. Raises KeyError if there is no such book.
+    # Why: Ids stay valid while other books are added and removed, and the backend finds the book
+    # through its id index instead of by position.
+    def delete(self, book_id):
+        self.wait_until_loaded()
+        collection, book = self._lookup(book_id)
+        with instrumentation.span("storage.remove"):
+            self._backend.remove(book_id)
+        self._index_books("remove", collection, [(book, book.status)])
+        self._changed()
+        self._notify("remove", collection, None, book)
+
+    # Set the status ("To Read", "Reading", "Read", ...) of a book. Raises KeyError if there is
+    # no such book.
+    def update_status(self, book_id, status):
+        self.wait_until_loaded()
+        collection, book = self._lookup(book_id)
+        old_status = book.status  # The JSON backend updates this Book in place
+        with instrumentation.span("storage.update_status"):
+            self._backend.update_status(book_id, status)
+        self._index_books("remove", collection, [(book, old_status)], search=False)
+        self._index_books("add", collection, [(book, status)], search=False)
+        self._changed()
+        self._notify("update", collection, None, book)
+
+    # Move a book to another collection, keeping its id. A book moved into 'My Books' without a
+    # status gets "To Read". Returns False (and moves nothing) when duplicates are rejected and
+    # the book is already in the target collection. Raises KeyError if there is no such book.
+    def move(self, book_id, to_collection):
+        self.wait_until_loaded()
+        if to_collection not in ("my_books", "wishlist"):
+            raise ValueError(f"Unknown collection: {to_collection}")
+        collection, book = self._lookup(book_id)
+        if collection == to_collection:
+            return True
+        if self._reject_duplicates and self.contains(to_collection, book["title"], book["author"]):
+            return False
+        old_status = book.status
+        new_status = "To Read" if to_collection == "my_books" and old_status is None else old_status
+        with instrumentation.span("storage.move"), self._backend.batch():
+            self._backend.move(book_id, to_collection)
+            if new_status != old_status:
+                self._backend.update_status(book_id, new_status)
+        self._index_books("remove", collection, [(book, old_status)])
+        self._index_books("add", to_collection, [(book, new_status)])
+        self._changed()
+        self._notify("remove", collection, None, book)
+        self._notify("insert", to_collection, None, book)
+        return True
+
+    def _lookup(self, book_id):
+        found = self._backend.get(book_id)
+        if found is None:
+            raise KeyError(book_id)
+        return found
+
+    # Register callback(event, collection, index, book) to be told about changes.
+    # Why: Lets the UI apply targeted row inserts/removals instead of re-reading whole lists.
+    # event is "insert", "remove", "update" or "reload"; index and book are None on reload, and
+    # collection is None too when every collection was reloaded. index is also None when the
+    # position of the book isn't known (changes made by id); the book is still given.
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        self._listeners.remove(callback)
+
+    def _notify(self, event, collection, index, book):
+        for callback in list(self._listeners):
+            callback(event, collection, index, book)
+
+    # Return True if a book with this title and author is in the collection.
+    # Why: Duplicate checks go through the backend's key index instead of scanning the list.
+    def contains(self, collection, title, author):
+        return self.find(collection, title, author) is not None
+
+    # Return the first book in the collection matching title and author (case and spacing
+    # insensitive), or None.
+    def find(self, collection, title, author):
+        self.wait_until_loaded()
+        return self._backend.find(collection, book_key(title, author))
+
+    # Return the position of a book (or an equal one) in the collection, or None.
+    def index_of(self, collection, book):
+        self.wait_until_loaded()
+        return self._backend.index_of(collection, book)
+
+    # Search titles and authors; returns up to limit (collection, book) pairs.
+    # Why: Typo-tolerant prefix search through the SearchIndex instead of scrolling the list.
+    def search(self, query, collection=None, limit=50):
+        self.wait_until_loaded()
+        if self._search_index is None:
+            self._search = True
+            self._load_search_index()
+        results = []
+        with instrumentation.span("search.query"):
+            matches = self._search_index.search(query, collection, limit)
+        for found_collection, title_key, author_key in matches:
+            book = self._backend.find(found_collection, (title_key, author_key))
+            if book is not None:
+                results.append((found_collection, book))
+        return results
+
+    # Load the saved search index if it matches the data on disk, otherwise rebuild it.
+    def _load_search_index(self):
+        index = None
+        if self._search_index_path:
+            index = SearchIndex.load(self._search_index_path, self._storage_fingerprint())
+        self._search_index_dirty = index is None
+        if index is None:
+            index = self._build_search_index()
+        self._search_index = index
+
+    def _build_search_index(self):
+        index = SearchIndex()
+        for collection in ("my_books", "wishlist"):
+            for book in BookListView(self._backend, collection):
+                index.add(collection, book["title"], book["author"])
+        return index
+
+    # Keep the search index, the statistics and the sorted indexes in step with added or removed
+    # books. entries are (book, status) pairs, status being the one the book was (or is now) stored
+    # with. search=False leaves the search index alone, for changes that only touch the status
+    # (a remove and add that keep the book's place in the list).
+    def _index_books(self, action, collection, entries, search=True):
+        if not entries:
+            return
+        if search and self._search_index is not None:
+            for book, status in entries:
+                if action == "add":
+                    self._search_index.add(collection, book.title, book.author)
+                else:
+                    self._search_index.remove(collection, book.title, book.author)
+            self._search_index_dirty = True
+        if self._stats is not None:
+            for book, status in entries:
+                if action == "add":
+                    self._stats.add(collection, book.author, status)
+                else:
+                    self._stats.remove(collection, book.author, status)
+        for (indexed_collection, order), index in self._sorted.items():
+            if indexed_collection != collection:
+                continue
+            if action == "add":
+                index.add_many(entries)
+            else:
+                for book, status in entries:
+                    index.remove(book, status, keep_place=not search)
+
+    # Books per collection, status and author, kept up to date as books change.
+    # Why: Counted once (while loading with stats=True, else on the first call) and then updated
+    # incrementally, so reading the numbers never walks the library.
+    def stats(self):
+        self.wait_until_loaded()
+        if self._stats is None:
+            self._stats = self._count_books()
+        return self._stats
+
+    def _count_books(self):
+        stats = LibraryStats()
+        for collection in ("my_books", "wishlist"):
+            for book in BookListView(self._backend, collection):
+                stats.add(collection, book.author, book.status)
+        return stats
+
+    # Return a collection's books in the given order ("added", "title" or "author", see
+    # SORT_KEYS), optionally only those with one status ("" for books without a status).
+    # Why: The default order is the stored list itself. A backend with sorted_pages (SQLite) pages
+    # through any other view with indexed queries; otherwise it reads a SortedBookIndex, which is
+    # sorted once (while loading with sort_indexes=True, else on first use) and then kept sorted
+    # as books change. The returned sequence is live, like my_books and wishlist.
+    def books(self, collection, order="added", status=None):
+        self.wait_until_loaded()
+        if order not in SORT_KEYS:
+            raise ValueError(f"Unknown sort order: {order}")
+        if order == "added" and status is None or self._backend.sorted_pages:
+            return BookListView(self._backend, collection, order, status)
+        return SortedBookView(self, collection, order, status)
+
+    # Every SortedBookIndex books() can use, with sort_indexes=True; otherwise none, and they are
+    # built on first use.
+    # Why: Sorting a large collection takes seconds (about 7 s for 1M books), which must not
+    # happen on the Tk thread the first time the user picks a sort order or a filter. Each
+    # collection is read once for all orders.
+    def _build_sorted_indexes(self):
+        indexes = {}
+        if not self._sort_indexes or self._backend.sorted_pages:
+            return indexes
+        for collection in ("my_books", "wishlist"):
+            books = list(BookListView(self._backend, collection))
+            for order in SORT_KEYS:
+                with instrumentation.span("index.build:" + order):
+                    indexes[(collection, order)] = SortedBookIndex.build(order, books)
+        return indexes
+
+    def _sorted_keys(self, collection, order, status):
+        index = self._sorted.get((collection, order))
+        if index is None:
+            with instrumentation.span("index.build:" + order):
+                index = self._sorted[(collection, order)] = SortedBookIndex.build(order, BookListView(self._backend, collection))
+        return index.keys(status)
+
+    # Size and modification time of the backend's files, used to tell whether a saved search
+    # index still matches the data.
+    def _storage_fingerprint(self):
+        fingerprint = []
+        for path in self._backend.storage_files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            fingerprint.append([os.path.basename(path), stat.st_size, stat.st_mtime_ns])
+        return fingerprint
+
+    # Group several changes so the backend persists them together.
+    # Why: One write (or one SQLite transaction) for a batch is far cheaper than one per change.
+    # If the block fails the backend may roll back changes the indexes already include (SQLite
+    # does, the JSON backend keeps them), so the indexes are rebuilt from what is stored.
+    @contextlib.contextmanager
+    def batch(self):
+        self.wait_until_loaded()
+        try:
+            with self._backend.batch():
+                yield
+        except BaseException:
+            self._rebuild_indexes()
+            self._changed()
+            self._notify("reload", None, None, None)
+            raise
+
+    # Rebuild the search index and the statistics that are in use, and the sorted indexes if they
+    # are built while loading (otherwise they are dropped and built again on first use).
+    def _rebuild_indexes(self):
+        if self._search_index is not None:
+            self._search_index = self._build_search_index()
+            self._search_index_dirty = True
+        if self._stats is not None:
+            self._stats = self._count_books()
+        self._sorted = self._build_sorted_indexes()
+
+    # Write any changes that are still waiting in the write-behind queue.
+    # Why: Called before the app exits so nothing queued is lost.
+    def flush(self):
+        self.wait_until_loaded()
+        if self._writer is not None:
+            self._writer.flush()
+        else:
+            with instrumentation.span("storage.flush"):
+                self._backend.flush()
+
+    # Flush pending changes and release the backend's files and connections.
+    # The search index is saved afterwards, so its fingerprint matches the final files.
+    # Why: Saving a large index takes seconds (about 8 s for 500k books) and close() runs on the Tk
+    # thread at every logout, so the save runs on a non-daemon thread that the interpreter only
+    # waits for at exit. A reader that opens the index first just finds a stale fingerprint.
+    def close(self):
+        self.wait_until_loaded()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._backend.close()
+        if self._search_index is not None and self._search_index_path and self._search_index_dirty:
+            self._search_index_dirty = False
+            saver = threading.Thread(target=_save_search_index,
+                                     args=(self._search_index, self._search_index_path, self._storage_fingerprint()))
+            saver.start()
+
+    # Tell the write-behind queue a change is waiting.
+    def _changed(self):
+        if self._writer is not None:
+            self._writer.notify_change()
+
+_index_save_lock = threading.Lock()  # One index save at a time
+
+def _save_search_index(index, path, fingerprint):
+    with _index_save_lock:
+        try:
+            index.save(path, fingerprint)
+        except OSError as e:
+            print(f"Error saving search index: {e}")
+
+# Build the normalized (title, author) key used to detect duplicate books.
+# Why: "The Hobbit " and "the hobbit" by the same author should count as the same book.
+def book_key(title, author):
+    return (" ".join(title.split()).casefold(), " ".join(author.split()).casefold())
+
+# Compact in-memory record for one book.
+# Why: A dict per book costs far more than three slots, and the same status (and often the same
+# author) was stored once per book; author and status are interned so equal values share one
+# string. Books still read like the old dicts (book["title"], book.get("status")) and are written
+# to JSON in the same {"title", "author", "status"} format, plus the book's "id".
+# The id is assigned by the storage backend when the book is added and never changes or gets
+# reused, so the UI can refer to a book by id however the lists shift around it.
+class Book:
+    __slots__ = ("id", "title", "author", "status")
+
+    def __init__(self, title, author, status=None, book_id=None):
+        self.id = book_id
+        self.title = title
+        self.author = sys.intern(author)
+        self.status = None if status is None else sys.intern(status)
+
+    # Build a Book from a {"title", "author", "status", "id"} mapping (a dict or another Book).
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["title"], data["author"], data.get("status"), data.get("id"))
+
+    # Return the JSON form of the book; a missing status (or id) is left out, as before.
+    # Exports pass include_id=False, since ids only mean something inside one book file.
+    def to_dict(self, include_id=True):
+        book = {"id": self.id} if include_id and self.id is not None else {}
+        book["title"] = self.title
+        book["author"] = self.author
+        if self.status is not None:
+            book["status"] = self.status
+        return book
+
+    def __getitem__(self, key):
+        value = getattr(self, key, None) if key in Book.__slots__ else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    # A dict without an "id" (the {"title", "author", "status"} form books had before ids) is
+    # compared with the book's fields only, so it still equals the book it describes.
+    def __eq__(self, other):
+        if isinstance(other, Book):
+            return self.id == other.id and self.title == other.title and self.author == other.author and self.status == other.status
+        if isinstance(other, dict):
+            return self.to_dict(include_id="id" in other) == other
+        return NotImplemented
+
+    __hash__ = None  # Mutable, like the dicts it replaces
+
+    def __repr__(self):
+        return f"Book({self.title!r}, {self.author!r}, {self.status!r}, book_id={self.id!r})"
+
+# json object_hook that turns every {"title", "author", ...} object into a Book as it is parsed.
+# Why: The parser's dict for each book is dropped straight away instead of the whole file's worth
+# of dicts being held until a conversion pass at the end.
+def _book_from_json(obj):
+    if "title" in obj and "author" in obj:
+        return Book(obj["title"], obj["author"], obj.get("status"), obj.get("id"))
+    return obj
+
+# Statuses a book in 'My Books' moves through; the UI's status button cycles through them in order.
+BOOK_STATUSES = ("To Read", "Reading", "Read")
+
+# json default= hook that writes Books in their dict form.
+def _book_to_json(obj):
+    if isinstance(obj, Book):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+# Split text into lowercase word tokens for the search index.
+def search_tokens(text):
+    return _TOKEN_RE.findall(text.casefold())
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# Padded trigrams of a token ("cat" -> "$ca", "cat", "at$"), used for typo-tolerant matching.
+def _trigrams(token):
+    padded = f"${token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+# Edit distance between two words, counting a swap of adjacent letters as one edit.
+def _edit_distance(a, b):
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[len(b)]
+
+# In-memory full-text index over book titles and authors.
+# Why: An inverted token index answers exact and prefix queries, and a trigram index over the
+# vocabulary finds near-misses ("tolkein" -> "tolkien"), without scanning the library.
+# Documents are (collection, title_key, author_key, words) tuples, words being the document's
+# distinct tokens as one " a b c" string; they are counted so duplicates can be added and removed.
+# Each document is stored once (the same tuple is the _doc_ids key and the _docs entry), author
+# keys and tokens are interned, and postings are int arrays kept per collection; that comes to
+# roughly 350 bytes per book on top of the library itself.
+class SearchIndex:
+    FORMAT_VERSION = 2
+    SCAN_LIMIT = 500  # Non-matching documents checked one by one before switching to postings sets
+
+    def __init__(self):
+        self._doc_ids = {}  # doc -> doc id
+        self._docs = []  # doc id -> doc, or None once removed
+        self._copies = {}  # doc id -> number of copies, only for documents added more than once
+        self._free_ids = []
+        self._postings = {}  # collection -> token -> array of doc ids
+        self._vocab = []  # Sorted tokens of every collection, for prefix lookups
+        self._trigrams = {}  # trigram -> set of tokens
+
+    def __len__(self):
+        return len(self._doc_ids)
+
+    # The document for a book. Its tokens are kept with it, so searches never re-tokenize: a term
+    # is a prefix of one of its words exactly when " " + term occurs in the words string.
+    @staticmethod
+    def _doc(collection, title, author):
+        title_key, author_key = book_key(title, author)
+        words = " " + " ".join(sorted(set(search_tokens(title_key + " " + author_key))))
+        return (collection, title_key, sys.intern(author_key), words)
+
+    # Index a book (title and author) in a collection.
+    def add(self, collection, title, author):
+        doc = self._doc(collection, title, author)
+        doc_id = self._doc_ids.get(doc)
+        if doc_id is not None:
+            self._copies[doc_id] = self._copies.get(doc_id, 1) + 1
+            return
+        doc_id = self._free_ids.pop() if self._free_ids else len(self._docs)
+        if doc_id == len(self._docs):
+            self._docs.append(None)
+        self._docs[doc_id] = doc
+        self._doc_ids[doc] = doc_id
+        postings = self._postings.setdefault(collection, {})
+        for token in doc[3].split():
+            doc_ids = postings.get(token)
+            if doc_ids is None:
+                token = sys.intern(token)
+                if not self._in_vocab(token):
+                    bisect.insort(self._vocab, token)
+                    for trigram in _trigrams(token):
+                        self._trigrams.setdefault(trigram, set()).add(token)
+                doc_ids = postings[token] = array.array("l")
+            doc_ids.append(doc_id)
+
+    # Remove one copy of a book from the index.
+    def remove(self, collection, title, author):
+        doc = self._doc(collection, title, author)
+        doc_id = self._doc_ids.get(doc)
+        if doc_id is None:
+            return
+        copies = self._copies.pop(doc_id, 1)
+        if copies > 1:
+            if copies > 2:
+                self._copies[doc_id] = copies - 1
+            return
+        del self._doc_ids[doc]
+        self._docs[doc_id] = None
+        self._free_ids.append(doc_id)
+        postings = self._postings[collection]
+        for token in doc[3].split():
+            doc_ids = postings[token]
+            doc_ids.remove(doc_id)
+            if doc_ids:
+                continue
+            del postings[token]
+            if not self._in_vocab(token):
+                del self._vocab[bisect.bisect_left(self._vocab, token)]
+                for trigram in _trigrams(token):
+                    tokens = self._trigrams[trigram]
+                    tokens.discard(token)
+                    if not tokens:
+                        del self._trigrams[trigram]
+
+    def _in_vocab(self, token):
+        return any(token in postings for postings in self._postings.values())
+
+    # Return up to limit (collection, title_key, author_key) matches for a query.
+    # Every query word must match a title/author word exactly, as a prefix, or (if nothing
+    # matches that way) as a close trigram match. Exact matches come first.
+    # Why: The term with the fewest postings in the searched collections drives the search and
+    # the others are checked against each document's stored words, so a query with plenty of
+    # matches stops after a few documents. If many documents are rejected first, matches are
+    # sparse: the next smallest term's postings are merged into one set of ids, and the rest of
+    # the driving postings are intersected with it in C instead of checked one by one.
+    def search(self, query, collection=None, limit=50):
+        terms = search_tokens(query)
+        if not terms:
+            return []
+        if collection is None:
+            postings = list(self._postings.values())
+        else:
+            postings = [self._postings.get(collection, {})]
+        matchers = []
+        for term in terms:
+            candidates, fuzzy = self._candidates(term)
+            size = sum(sum(map(len, filter(None, map(collection_postings.get, candidates)))) for collection_postings in postings)
+            if not size:
+                return []
+            matchers.append((size, term, candidates, set(candidates) if fuzzy else ()))
+        matchers.sort(key=lambda matcher: matcher[0])
+        driving = matchers[0][2]
+        others = [(" " + term, fuzzy) for _, term, _, fuzzy in matchers[1:]]
+        # Adding an id to a set costs about a tenth of checking a document, so scan that much first
+        scan_limit = max(self.SCAN_LIMIT, matchers[1][0] // 10) if others else 0
+        results = []
+        seen = set()
+        scanned = 0
+        for position, token in enumerate(driving):
+            for collection_postings in postings:
+                for doc_id in collection_postings.get(token, ()):
+                    if doc_id in seen:
+                        continue
+                    doc = self._docs[doc_id]
+                    for needle, fuzzy in others:
+                        if needle not in doc[3] and not (fuzzy and fuzzy.intersection(doc[3].split())):
+                            break
+                    else:
+                        seen.add(doc_id)
+                        results.append(doc[:3])
+                        if len(results) >= limit:
+                            return results
+                        continue
+                    scanned += 1
+                    if scanned > scan_limit:
+                        return self._search_sparse(postings, driving[position:], matchers[1:], results, seen, limit)
+        return results
+
+    # Finish a search whose other terms rarely match: turn the next smallest term's postings
+    # into a set once, keep only the driving tokens' documents in it, and check any remaining
+    # terms against those documents' words.
+    def _search_sparse(self, postings, driving, others, results, seen, limit):
+        matching = self._doc_set(postings, others[0][2])
+        rest = [(" " + term, fuzzy) for _, term, _, fuzzy in others[1:]]
+        for token in driving:
+            for collection_postings in postings:
+                for doc_id in sorted(matching.intersection(collection_postings.get(token, ()))):
+                    if doc_id in seen:
+                        continue
+                    doc = self._docs[doc_id]
+                    for needle, fuzzy in rest:
+                        if needle not in doc[3] and not (fuzzy and fuzzy.intersection(doc[3].split())):
+                            break
+                    else:
+                        seen.add(doc_id)
+                        results.append(doc[:3])
+                        if len(results) >= limit:
+                            return results
+        return results
+
+    # Ids of the documents holding any of these tokens.
+    @staticmethod
+    def _doc_set(postings, tokens):
+        doc_set = set()
+        for collection_postings in postings:
+            for token in tokens:
+                doc_set.update(collection_postings.get(token, ()))
+        return doc_set
+
+    # Vocabulary tokens that match one query term: the exact token first, then prefix matches,
+    # then (only if there were none) tokens sharing enough trigrams with the term.
+    # Returns (tokens, fuzzy) where fuzzy says whether the trigram fallback was used.
+    def _candidates(self, term):
+        start = bisect.bisect_left(self._vocab, term)
+        end = bisect.bisect_left(self._vocab, term[:-1] + chr(ord(term[-1]) + 1), start)  # First token past the prefix
+        if end > start:
+            return self._vocab[start:end], False
+        if len(term) < 3:
+            return [], False
+        term_trigrams = _trigrams(term)
+        shared = collections.Counter()
+        for trigram in term_trigrams:
+            shared.update(self._trigrams.get(trigram, ()))
+        # Trigram overlap and length narrow the vocabulary down; edit distance decides
+        min_shared = max(1, len(term_trigrams) // 3)
+        max_distance = max(1, len(term) // 3)
+        scored = []
+        for token, count in shared.items():
+            if count < min_shared or abs(len(token) - len(term)) > max_distance:
+                continue
+            distance = _edit_distance(term, token)
+            if distance <= max_distance:
+                scored.append((distance, -count, token))
+        scored.sort()
+        return [token for _, _, token in scored[:20]], True
+
+    # Write the index to path as JSON, tagged with a fingerprint of the data it was built from.
+    def save(self, path, fingerprint):
+        ids = {}
+        docs = []
+        for doc_id, doc in enumerate(self._docs):
+            if doc is not None:
+                ids[doc_id] = len(docs)
+                docs.append([doc[0], doc[1], doc[2], self._copies.get(doc_id, 1)])
+        data = {
+            "version": self.FORMAT_VERSION,
+            "fingerprint": fingerprint,
+            "docs": docs,
+            "postings": {collection: {token: [ids[doc_id] for doc_id in doc_ids] for token, doc_ids in postings.items()}
+                         for collection, postings in self._postings.items()},
+        }
+        _write_atomic(path, data)
+
+    # Load an index saved by save(); returns None if it is missing, unreadable or stale.
+    # Each document's tokens are collected back from the postings rather than re-tokenized.
+    @classmethod
+    def load(cls, path, fingerprint):
+        try:
+            with open(path, "r") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != cls.FORMAT_VERSION or data.get("fingerprint") != fingerprint:
+            return None
+        index = cls()
+        doc_tokens = [[] for _ in data["docs"]]
+        vocab = set()
+        for collection, postings in data["postings"].items():
+            index_postings = index._postings[collection] = {}
+            for token, doc_ids in postings.items():
+                token = sys.intern(token)
+                vocab.add(token)
+                index_postings[token] = array.array("l", doc_ids)
+                for doc_id in doc_ids:
+                    doc_tokens[doc_id].append(token)
+        for doc_id, (collection, title_key, author_key, copies) in enumerate(data["docs"]):
+            doc = (collection, title_key, sys.intern(author_key), " " + " ".join(sorted(doc_tokens[doc_id])))
+            index._docs.append(doc)
+            index._doc_ids[doc] = doc_id
+            if copies > 1:
+                index._copies[doc_id] = copies
+        index._vocab = sorted(vocab)
+        for token in index._vocab:
+            for trigram in _trigrams(token):
+                index._trigrams.setdefault(trigram, set()).add(token)
+        return index
+
+# Sort keys for the orders a book list can be shown in. Each key ends with the book's id, so no
+# two books share a key. "added" is the collection's stored order, the one the unsorted list shows,
+# filtered or not; it has no key of its own, see SortedBookIndex. (The JSON list puts a book moved
+# in from the other collection last; SQLite stores by id, so a moved book keeps its place.)
+SORT_KEYS = {
+    "added": None,
+    "title": lambda book: book_key(book.title, book.author) + (book.id,),
+    "author": lambda book: book_key(book.title, book.author)[::-1] + (book.id,),
+}
+
+# Running totals for a library: books per collection, per status and per author.
+# Why: The home screen's counts are read from these counters, which are updated on every add,
+# delete, move and status change, instead of walking the whole library on each visit.
+class LibraryStats:
+    def __init__(self):
+        self._totals = {"my_books": 0, "wishlist": 0}
+        self._statuses = {"my_books": collections.Counter(), "wishlist": collections.Counter()}  # status -> books
+        self._authors = {"my_books": collections.Counter(), "wishlist": collections.Counter()}  # author key -> books
+        self._author_names = {}  # author key -> spelling shown for it
+        self._top_authors = {}  # (collection, limit) -> cached top_authors() result
+
+    # Count a book (by its author and status) in a collection.
+    def add(self, collection, author, status):
+        key = " ".join(author.split()).casefold()
+        self._totals[collection] += 1
+        self._statuses[collection][status] += 1
+        self._authors[collection][key] += 1
+        self._author_names.setdefault(key, author)
+        self._forget_top_authors(collection)
+
+    # Stop counting a book that was counted with add().
+    def remove(self, collection, author, status):
+        key = " ".join(author.split()).casefold()
+        self._totals[collection] -= 1
+        statuses = self._statuses[collection]
+        statuses[status] -= 1
+        if statuses[status] <= 0:
+            del statuses[status]
+        authors = self._authors[collection]
+        authors[key] -= 1
+        if authors[key] <= 0:
+            del authors[key]
+            if not any(key in counts for counts in self._authors.values()):
+                del self._author_names[key]
+        self._forget_top_authors(collection)
+
+    # Number of books in a collection.
+    def total(self, collection):
+        return self._totals[collection]
+
+    # Books per status in a collection, as a {status: count} dict; None counts books without one.
+    def by_status(self, collection):
+        return dict(self._statuses[collection])
+
+    # The limit authors with the most books in a collection, as (author, count) pairs.
+    # Why: Cached until the collection changes, so redrawing the home screen doesn't rank every
+    # author again.
+    def top_authors(self, collection, limit=5):
+        cached = self._top_authors.get((collection, limit))
+        if cached is None:
+            ranked = self._authors[collection].most_common(limit)
+            cached = self._top_authors[(collection, limit)] = [(self._author_names[key], count) for key, count in ranked]
+        return list(cached)
+
+    def _forget_top_authors(self, collection):
+        if self._top_authors:
+            self._top_authors = {key: value for key, value in self._top_authors.items() if key[0] != collection}
+
+# Sort keys of one collection's books in one order, kept sorted as books come and go.
+# Why: Sorted and status-filtered lists are read from here instead of re-sorting the collection
+# on every visit. A single change is a binary search plus one list insert or delete, and a bulk
+# add appends and sorts, which Timsort does as a linear merge of the new run into the old one.
+# Besides the list of every book there is one list per status ("" for books without a status).
+# In the "added" order a book's key is (entry, id), entry counting the books as they are built in
+# stored order or added later, so a new or moved-in book comes last, as in the stored list.
+class SortedBookIndex:
+    BULK_THRESHOLD = 16  # Adds of at least this many books are merged in rather than inserted one by one
+
+    def __init__(self, order):
+        self._key = SORT_KEYS[order] or self._entry_key
+        self._entries = {} if order == "added" else None  # id -> key, for the "added" order
+        self._next_entry = 0
+        self._all = []
+        self._by_status = {}  # status -> sorted keys of the books with that status
+
+    def _entry_key(self, book):
+        key = self._entries.get(book.id)
+        if key is None:
+            key = self._entries[book.id] = (self._next_entry, book.id)
+            self._next_entry += 1
+        return key
+
+    # Build an index from an iterable of Books in one sort.
+    # Why: The per-status lists are split off the sorted list of every book, which keeps them
+    # in order without sorting each one again.
+    @classmethod
+    def build(cls, order, books):
+        index = cls(order)
+        statuses = {}
+        for book in books:
+            index._all.append(index._key(book))
+            statuses[book.id] = book.status or ""
+        index._all.sort()
+        for key in index._all:
+            index._by_status.setdefault(statuses[key[-1]], []).append(key)
+        return index
+
+    # Sorted keys of the books with this status ("" for none), or of every book if status is None.
+    # The list is live: it changes as books are added and removed. The last item of a key is the id.
+    def keys(self, status=None):
+        if status is None:
+            return self._all
+        return self._by_status.get(status, [])
+
+    # Add a book that has the given status.
+    def add(self, book, status):
+        key = self._key(book)
+        bisect.insort(self._all, key)
+        bisect.insort(self._by_status.setdefault(status or "", []), key)
+
+    # Add many (book, status) pairs.
+    def add_many(self, entries):
+        if len(entries) < self.BULK_THRESHOLD:
+            for book, status in entries:
+                self.add(book, status)
+            return
+        changed = set()
+        for book, status in entries:
+            key = self._key(book)
+            self._all.append(key)
+            self._by_status.setdefault(status or "", []).append(key)
+            changed.add(status or "")
+        self._all.sort()
+        for status in changed:
+            self._by_status[status].sort()
+
+    # Remove a book that was added with the given status. keep_place=True is for a status change:
+    # the book is added back right after and keeps its place in the "added" order.
+    def remove(self, book, status, keep_place=False):
+        key = self._key(book)
+        if self._entries is not None and not keep_place:
+            del self._entries[book.id]
+        _remove_sorted(self._all, key)
+        keys = self._by_status.get(status or "")
+        if keys is not None:
+            _remove_sorted(keys, key)
+            if not keys:
+                del self._by_status[status or ""]
+
+def _remove_sorted(keys, key):
+    position = bisect.bisect_left(keys, key)
+    if position < len(keys) and keys[position] == key:
+        del keys[position]
+
+# Read-only sequence over a collection in sorted order and/or filtered to one status.
+# Why: Behaves like the list views (len, indexing, iteration) so a VirtualBookList can show it,
+# while only the books on screen are looked up by id. Keys are fetched from the collection on
+# every access, so the view stays valid after the data is reloaded.
+class SortedBookView:
+    def __init__(self, book_collection, collection, order, status):
+        self._book_collection = book_collection
+        self._collection = collection
+        self._order = order
+        self._status = status
+
+    def _keys(self):
+        return self._book_collection._sorted_keys(self._collection, self._order, self._status)
+
+    def __len__(self):
+        return len(self._keys())
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._book_collection.get(key[-1]) for key in self._keys()[index]]
+        return self._book_collection.get(self._keys()[index][-1])
+
+    def __iter__(self):
+        for key in list(self._keys()):
+            book = self._book_collection.get(key[-1])
+            if book is not None:
+                yield book
+
+# Background thread that makes a backend's deferred changes durable.
+# Why: Disk writes never run inside Tk callbacks; bursts of changes are coalesced into one write,
+# done every `interval` seconds or as soon as `max_pending` changes have piled up.
+class WriteBehindQueue:
+    def __init__(self, backend, interval=1.0, max_pending=50, on_error=None):
+        self._backend = backend
+        self._interval = interval
+        self._max_pending = max_pending
+        self._on_error = on_error
+        self._pending = 0
+        self._failing = False  # Only the first error of a run of failed writes is reported
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # Record that the backend has one more change waiting to be written.
+    def notify_change(self):
+        self._pending += 1
+        if self._pending >= self._max_pending:
+            self._wake.set()
+
+    # Write everything now, on the calling thread. Errors propagate to the caller.
+    def flush(self):
+        self._pending = 0
+        with instrumentation.span("storage.flush"):
+            self._backend.flush()
+
+    # Stop the thread and write whatever is still pending.
+    def close(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            if self._stopped or not self._pending:
+                continue
+            self._pending = 0
+            try:
+                with instrumentation.span("storage.flush"):
+                    self._backend.flush()
+                self._failing = False
+            except Exception as e:
+                self._pending += 1  # The backend kept the changes; try again next time
+                if self._failing:
+                    continue
+                self._failing = True
+                if self._on_error is not None:
+                    self._on_error(e)
+                else:
+                    print(f"Error saving books: {e}")
+
+# Lazy, read-only sequence over one collection of a storage backend.
+# Why: Lets my_books/wishlist behave like lists while the backend only fetches the pages
+# that are actually looked at.
+class BookListView:
+    PAGE_SIZE = 256
+
+    # order and status are only supported by a backend with sorted_pages; the default is the
+    # stored list of every book.
+    def __init__(self, backend, collection, order="added", status=None):
+        self._backend = backend
+        self._collection = collection
+        self._query = () if order == "added" and status is None else (order, status)
+        self._page_start = None
+        self._page = []
+        self._page_version = None
+
+    def _fetch(self, start, limit):
+        return self._backend.page(self._collection, start, limit, *self._query)
+
+    def __len__(self):
+        return self._backend.count(self._collection, *self._query[1:])
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __getitem__(self, index):
+        size = len(self)
+        if isinstance(index, slice):
+            start, stop, step = index.indices(size)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return self._fetch(start, max(0, stop - start))
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("book index out of range")
+        page_start = index - index % self.PAGE_SIZE
+        if page_start != self._page_start or self._page_version != self._backend.version:
+            self._page = self._fetch(page_start, self.PAGE_SIZE)
+            self._page_start = page_start
+            self._page_version = self._backend.version
+        return self._page[index - page_start]
+
+    def __iter__(self):
+        start = 0
+        while True:
+            page = self._fetch(start, self.PAGE_SIZE)
+            yield from page
+            if len(page) < self.PAGE_SIZE:
+                return
+            start += self.PAGE_SIZE
+
+# Fenwick tree over a list of 0/1 counts (one per slot of a JsonFileBackend collection).
+# Why: Answers "how many live books come before this slot" and "which slot holds the book at
+# this position" in O(log n), and still supports appending a slot in O(log n).
+class _RankTree:
+    def __init__(self, size=0):
+        self._tree = [0] + [1] * size  # 1-based; every slot starts live
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                self._tree[parent] += self._tree[i]
+
+    def append(self, count):
+        tree = self._tree
+        i = len(tree)
+        total = count
+        j = i - 1
+        while j > i - (i & -i):
+            total += tree[j]
+            j -= j & -j
+        tree.append(total)
+
+    def add(self, slot, delta):
+        tree = self._tree
+        i = slot + 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    # Number of live slots before this slot.
+    def rank(self, slot):
+        tree = self._tree
+        total = 0
+        i = slot
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    # Slot holding the live book at this position (0-based).
+    def find(self, position):
+        tree = self._tree
+        size = len(tree) - 1
+        slot = 0
+        remaining = position + 1
+        step = 1 << (size.bit_length() - 1) if size else 0
+        while step:
+            if slot + step <= size and tree[slot + step] < remaining:
+                slot += step
+                remaining -= tree[slot]
+            step >>= 1
+        return slot
+
+# Storage backend that keeps both collections in memory and persists them to a JSON file.
+# Why: The original storage format; with journal=True every change is appended to
+# "<filename>.journal" instead of rewriting the whole file, and once the journal grows past
+# compact_threshold bytes it is folded back into the snapshot on a background thread.
+# Each collection is a list of slots in list order plus a dict of id -> slot. A removed book leaves
+# an empty slot (a tombstone) behind, and a _RankTree over the slots turns a list position into a
+# slot, so removing a book and then reading any page costs O(log n) rather than a rebuild of the
+# list. Tombstones are dropped once they outnumber the books.
+class JsonFileBackend:
+    TOMBSTONE_LIMIT = 4096  # Never compact a collection's slots for fewer tombstones than this
+    sorted_pages = False  # page() and count() only serve the stored list; BookCollection sorts
+
+    def __init__(self, filename="books.json", journal=False, compact_threshold=1024 * 1024):
+        self._filename = filename
+        self._journal_filename = filename + ".journal"
+        self._journal = journal
+        self._compact_threshold = compact_threshold
+        self._slots = {"my_books": [], "wishlist": []}  # Books in list order; None where one was removed
+        self._slot_of = {"my_books": {}, "wishlist": {}}  # id -> index in _slots
+        self._ranks = {"my_books": _RankTree(), "wishlist": _RankTree()}  # 1 per live slot, 0 per tombstone
+        self._keys = {"my_books": {}, "wishlist": {}}  # book_key -> ids of the books with that key
+        self._next_id = 1  # Ids are never reused, so this only grows
+        self._seq = 0  # Sequence number of the last change applied
+        self._lock = threading.RLock()  # Guards the in-memory lists and the pending buffer
+        self._io_lock = threading.Lock()  # Serializes file writes; always taken before _lock
+        self._journal_file = None
+        self._journal_size = 0
+        self._compactor = None
+        self._compaction_tail = None  # Records appended while a compaction is running
+        self._batch_depth = 0
+        self._pending = []  # Journal lines (journal mode) or change records not yet on disk
+        self.deferred = False  # When True, changes wait for flush() instead of being written at once
+        self.version = 0  # Bumped on every change so lazy views can drop cached pages
+
+    def count(self, collection):
+        return len(self._slot_of[collection])
+
+    # Books at positions offset .. offset + limit - 1.
+    # Why: The first slot comes from the rank tree; the rest are read by walking the slots, going
+    # back to the tree only after a long run of tombstones.
+    def page(self, collection, offset, limit):
+        with self._lock:
+            slots = self._slots[collection]
+            limit = min(limit, self.count(collection) - offset)
+            if len(slots) == self.count(collection) or limit <= 0:
+                return slots[offset:offset + max(0, limit)]  # No tombstones
+            ranks = self._ranks[collection]
+            books = []
+            slot = ranks.find(offset)
+            skipped = 0
+            while len(books) < limit:
+                book = slots[slot]
+                slot += 1
+                if book is not None:
+                    books.append(book)
+                    skipped = 0
+                else:
+                    skipped += 1
+                    if skipped > 32:
+                        slot = ranks.find(offset + len(books))
+                        skipped = 0
+            return books
+
+    def find(self, collection, key):
+        with self._lock:
+            ids = self._keys[collection].get(key)
+            return self._slots[collection][self._slot_of[collection][ids[0]]] if ids else None
+
+    # Return (collection, book) for a book id, or None.
+    def get(self, book_id):
+        with self._lock:
+            for collection, slot_of in self._slot_of.items():
+                slot = slot_of.get(book_id)
+                if slot is not None:
+                    return collection, self._slots[collection][slot]
+            return None
+
+    # Position of a book (or an equal one) in the collection, or None. Only books with the same
+    # title and author can be equal, so those are looked up in the key index and ranked.
+    def index_of(self, collection, book):
+        with self._lock:
+            slots = self._slots[collection]
+            slot_of = self._slot_of[collection]
+            matches = [slot_of[book_id] for book_id in self._keys[collection].get(book_key(book["title"], book["author"]), [])]
+            matches = [slot for slot in matches if slots[slot] == book]
+            return self._ranks[collection].rank(min(matches)) if matches else None
+
+    def storage_files(self):
+        return [self._filename, self._journal_filename]
+
+    # Save the current book data to the JSON file.
+    # Why: The snapshot records the last applied sequence number, so journal entries it already
+    # contains are skipped on replay, and the journal can be emptied afterwards.
+    # A running compaction is waited for first: it writes its older snapshot without _io_lock,
+    # and would otherwise replace this one.
+    def save(self):
+        while True:
+            self.wait_for_compaction()
+            with self._io_lock:
+                if self._compactor is not None:
+                    continue  # Another compaction started before the lock was free
+                with self._lock:
+                    snapshot = self._snapshot()
+                    self._pending = []
+                _write_atomic(self._filename, snapshot)
+                if self._journal:
+                    self._rewrite_journal([])
+                return
+
+    # Write every pending change to disk in one go.
+    # Why: In journal mode that is one append and one fsync however many changes piled up;
+    # otherwise one snapshot rewrite. Failed writes are put back so a later flush retries them.
+    def flush(self):
+        with self._io_lock:
+            self._write_pending()
+
+    # Caller holds _io_lock.
+    def _write_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if not pending:
+                return
+            snapshot = None if self._journal else self._snapshot()
+        try:
+            if self._journal:
+                self._append_journal(pending)
+            else:
+                _write_atomic(self._filename, snapshot)
+        except BaseException:
+            with self._lock:
+                self._pending[:0] = pending
+            raise
+
+    # Load book data from the JSON file, replaying the journal on top in journal mode.
+    # Changes still waiting to be written are written first: reloading would otherwise drop them
+    # from memory, and the sequence numbers and ids they took would be handed out again.
+    def load(self):
+        with self._io_lock:
+            self._write_pending()
+            with self._lock:
+                try:
+                    data = _read_snapshot(self._filename, object_hook=_book_from_json)
+                    self._seq = data.get("seq", 0)
+                except FileNotFoundError:
+                    data = {}
+                    self._seq = 0
+                self._set_books(data.get("my_books", []), data.get("wishlist", []), data.get("next_id", 1))
+                if self._journal:
+                    self._replay_journal()
+                self.version += 1
+
+    # Add a book at the end of a collection; a book without an id is given the next free one.
+    def add(self, collection, book):
+        self._change({"op": "add", "collection": collection, "book": book})
+
+    def remove(self, book_id):
+        self._change({"op": "remove", "id": book_id})
+
+    def update_status(self, book_id, status):
+        self._change({"op": "status", "id": book_id, "status": status})
+
+    # Move a book to the end of another collection.
+    def move(self, book_id, to_collection):
+        self._change({"op": "move", "id": book_id, "collection": to_collection})
+
+    # Persist all changes made inside the block with a single write.
+    @contextlib.contextmanager
+    def batch(self):
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0 and not self.deferred:
+                self.flush()
+
+    # Block until a running compaction has finished.
+    # Why: Lets callers (and a clean shutdown) be sure the snapshot on disk is up to date.
+    def wait_for_compaction(self):
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+
+    def close(self):
+        self.flush()
+        self.wait_for_compaction()
+        with self._io_lock:
+            if self._journal_file is not None:
+                self._journal_file.close()
+                self._journal_file = None
+
+    # Apply a change in memory and queue it for disk, writing it straight away unless
+    # writes are deferred or a batch is open. Changes to unknown ids raise KeyError.
+    def _change(self, record):
+        with self._lock:
+            if "id" in record and self.get(record["id"]) is None:
+                raise KeyError(record["id"])
+            self._apply(record)
+            self.version += 1
+            if self._journal:
+                self._seq += 1
+                record = dict(record, seq=self._seq)
+                self._pending.append((json.dumps(record, default=_book_to_json) + "\n").encode("utf-8"))
+            else:
+                self._pending.append(record)
+        if not self.deferred and not self._batch_depth:
+            self.flush()
+
+    # Apply a single change record to the in-memory collections.
+    # Why: The same code path is used for live changes and for journal replay, so both agree.
+    # Journals written before books had ids hold "add" records without one and "delete" records
+    # by position; those are still replayed.
+    def _apply(self, record):
+        op = record["op"]
+        if op == "add":
+            collection = record["collection"]
+            if collection in self._slots:
+                book = record["book"]
+                if book.id is None:
+                    book.id = self._next_id
+                self._next_id = max(self._next_id, book.id + 1)
+                self._insert(collection, book)
+        elif op == "delete":
+            collection = "my_books" if record["collection"] == "my_books" else "wishlist"
+            self._pop(collection, self._slots[collection][self._ranks[collection].find(record["index"])].id)
+        elif op in ("remove", "status", "move"):
+            found = self.get(record["id"])
+            if found is None:
+                return
+            collection, book = found
+            if op == "status":
+                book.status = None if record["status"] is None else sys.intern(record["status"])
+            elif op == "remove":
+                self._pop(collection, book.id)
+            elif record["collection"] != collection:
+                self._pop(collection, book.id)
+                self._insert(record["collection"], book)
+
+    # Put a book at the end of a collection and into the key index.
+    def _insert(self, collection, book):
+        slots = self._slots[collection]
+        self._slot_of[collection][book.id] = len(slots)
+        slots.append(book)
+        self._ranks[collection].append(1)
+        self._keys[collection].setdefault(book_key(book.title, book.author), []).append(book.id)
+
+    # Take a book out of a collection and the key index, leaving a tombstone in its slot.
+    def _pop(self, collection, book_id):
+        slots = self._slots[collection]
+        slot = self._slot_of[collection].pop(book_id)
+        book = slots[slot]
+        slots[slot] = None
+        self._ranks[collection].add(slot, -1)
+        key = book_key(book.title, book.author)
+        ids = self._keys[collection][key]
+        ids.remove(book_id)
+        if not ids:
+            del self._keys[collection][key]
+        if len(slots) - self.count(collection) > max(self.TOMBSTONE_LIMIT, self.count(collection)):
+            self._compact_slots(collection, [book for book in slots if book is not None])
+        return book
+
+    # Books of a collection in list order. Caller holds _lock.
+    def _ordered(self, collection):
+        slots = self._slots[collection]
+        return list(slots) if len(slots) == self.count(collection) else [book for book in slots if book is not None]
+
+    # Lay a collection's books out in fresh slots, with no tombstones.
+    def _compact_slots(self, collection, books):
+        self._slots[collection] = books
+        self._slot_of[collection] = {book.id: slot for slot, book in enumerate(books)}
+        self._ranks[collection] = _RankTree(len(books))
+
+    # Replace the in-memory collections with freshly loaded lists of Books.
+    # Why: Files written before books had ids are given ids here, after any existing ones, so
+    # the ids a file already holds never change.
+    def _set_books(self, my_books, wishlist, next_id):
+        lists = {"my_books": my_books, "wishlist": wishlist}
+        self._next_id = max([next_id] + [book.id + 1 for books in lists.values() for book in books if book.id is not None])
+        self._keys = {"my_books": {}, "wishlist": {}}
+        for collection, books in lists.items():
+            keys = self._keys[collection]
+            for book in books:
+                if book.id is None:
+                    book.id = self._next_id
+                    self._next_id += 1
+                keys.setdefault(book_key(book.title, book.author), []).append(book.id)
+            self._compact_slots(collection, list(books))
+
+    # Append lines to the journal with a single flush and fsync. Caller holds _io_lock.
+    # Why: Journal mode turns each click into a small append instead of an O(n) rewrite.
+    def _append_journal(self, lines):
+        if self._journal_file is None:
+            self._journal_file = open(self._journal_filename, "ab")
+        data = b"".join(lines)
+        self._journal_file.write(data)
+        self._journal_file.flush()
+        os.fsync(self._journal_file.fileno())
+        self._journal_size += len(data)
+        if self._compaction_tail is not None:
+            self._compaction_tail.extend(lines)
+        elif self._journal_size > self._compact_threshold:
+            self._start_compaction()
+
+    # Replay journal records newer than the snapshot.
+    # Why: Restores changes made since the last compaction; a torn last line from a crash is cut off
+    # so that new records are not appended onto it.
+    def _replay_journal(self):
+        self._journal_size = 0
+        try:
+            with open(self._journal_filename, "rb") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line, object_hook=_book_from_json)
+                    except json.JSONDecodeError:
+                        break
+                    self._journal_size += len(line)
+                    if record.get("seq", 0) <= self._seq:
+                        continue
+                    self._apply(record)
+                    self._seq = record["seq"]
+            if self._journal_size != os.path.getsize(self._journal_filename):
+                os.truncate(self._journal_filename, self._journal_size)
+        except FileNotFoundError:
+            pass
+
+    # Return the data written to the snapshot file. Caller holds _lock.
+    def _snapshot(self):
+        return {"my_books": self._ordered("my_books"), "wishlist": self._ordered("wishlist"), "seq": self._seq,
+                "next_id": self._next_id}
+
+    # Replace the journal with the given lines. Caller holds _io_lock.
+    # Why: Used after compaction to drop records the snapshot already contains.
+    def _rewrite_journal(self, lines):
+        if self._journal_file is not None:
+            self._journal_file.close()
+            self._journal_file = None
+        _write_atomic(self._journal_filename, b"".join(lines), raw=True)
+        self._journal_size = sum(len(line) for line in lines)
+
+    # Start folding the journal into the snapshot on a background thread. Caller holds _io_lock.
+    # Why: Keeps the journal (and replay time on startup) bounded without blocking the UI.
+    # Changes still pending are already in the snapshot; when they reach the journal later their
+    # sequence numbers are covered by it and they are skipped on replay.
+    def _start_compaction(self):
+        with self._lock:
+            snapshot = self._snapshot()
+        self._compaction_tail = []
+        self._compactor = threading.Thread(target=self._compact, args=(snapshot,), daemon=True)
+        self._compactor.start()
+
+    # Write the snapshot, then keep only journal records appended while it was being written.
+    def _compact(self, snapshot):
+        try:
+            with instrumentation.span("storage.compact"):
+                _write_atomic(self._filename, snapshot)
+            with self._io_lock:
+                self._rewrite_journal(self._compaction_tail)
+        except OSError as e:
+            print(f"Error compacting book journal: {e}")
+        finally:
+            with self._io_lock:
+                self._compaction_tail = None
+                self._compactor = None
+
+# Columns a SQLite page is ordered by in each sort order (see SORT_KEYS); every order has an index
+# whose columns, followed by the rowid SQLite keeps in each index entry, match it.
+_SQL_ORDERS = {
+    "added": ("id",),
+    "title": ("norm_title", "norm_author", "id"),
+    "author": ("norm_author", "norm_title", "id"),
+}
+
+# Storage backend that keeps the books in a SQLite database.
+# Why: Only the rows being looked at are read into memory, every sorted or filtered list is read
+# down an index, and batched changes share one transaction. A book's id is its row id;
+# lists are ordered by id, so a book moved to another collection keeps its place in the order
+# books were added rather than going to the end.
+class SqliteBackend:
+    PAGE_STEP = 256  # Rows between the cached page boundaries
+    sorted_pages = True  # page() and count() can sort and filter by status in the database
+
+    def __init__(self, filename="books.db"):
+        self._filename = filename
+        self._conn = None
+        self._counts = {}
+        self._status_counts = {}  # (collection, status or "") -> books
+        self._boundaries = {}  # (collection, order, status) -> sort keys of every PAGE_STEP-th book, for page()
+        self._batch_depth = 0
+        self._lock = threading.RLock()  # The connection is shared with the write-behind thread
+        self._dirty = False  # Changes made but not committed
+        self._unsynced = False  # Committed to the write-ahead log but not yet fsynced
+        self._sync_conn = None  # Second connection that checkpoints the log, outside _lock
+        self._sync_lock = threading.Lock()
+        self.deferred = False  # When True, changes stay in the open transaction until flush()
+        self.version = 0
+
+    # Open the database, creating the schema on first use.
+    def load(self):
+        with self._lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(self._filename, check_same_thread=False)
+                # Commits only append to the write-ahead log; _sync() makes them durable
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+                self._conn.execute("PRAGMA wal_autocheckpoint=0")
+                self._conn.executescript(
+                    """
+                    CREATE TABLE IF NOT EXISTS books (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        collection TEXT NOT NULL,
+                        title TEXT NOT NULL,
+                        author TEXT NOT NULL,
+                        status TEXT,
+                        norm_title TEXT,
+                        norm_author TEXT
+                    );
+                    """
+                )
+                columns = {row[1] for row in self._conn.execute("PRAGMA table_info(books)")}
+                if "norm_title" not in columns:
+                    # Databases created before the key index existed get the columns filled in once
+                    self._conn.execute("ALTER TABLE books ADD COLUMN norm_title TEXT")
+                    self._conn.execute("ALTER TABLE books ADD COLUMN norm_author TEXT")
+                    rows = self._conn.execute("SELECT id, title, author FROM books").fetchall()
+                    self._conn.executemany(
+                        "UPDATE books SET norm_title = ?, norm_author = ? WHERE id = ?",
+                        [book_key(title, author) + (book_id,) for book_id, title, author in rows],
+                    )
+                # One index per order page() sorts by, with and without a status filter; idx_books_key
+                # also serves find(). The title/author/status indexes of older databases went unused.
+                self._conn.executescript(
+                    """
+                    DROP INDEX IF EXISTS idx_books_title;
+                    DROP INDEX IF EXISTS idx_books_author;
+                    DROP INDEX IF EXISTS idx_books_status;
+                    CREATE INDEX IF NOT EXISTS idx_books_collection ON books (collection, id);
+                    CREATE INDEX IF NOT EXISTS idx_books_key ON books (collection, norm_title, norm_author);
+                    CREATE INDEX IF NOT EXISTS idx_books_author_key ON books (collection, norm_author, norm_title);
+                    CREATE INDEX IF NOT EXISTS idx_books_status_added ON books (collection, IFNULL(status, ''));
+                    CREATE INDEX IF NOT EXISTS idx_books_status_title ON books (collection, IFNULL(status, ''), norm_title, norm_author);
+                    CREATE INDEX IF NOT EXISTS idx_books_status_author ON books (collection, IFNULL(status, ''), norm_author, norm_title);
+                    """
+                )
+            self._counts = dict(self._conn.execute("SELECT collection, COUNT(*) FROM books GROUP BY collection"))
+            self._status_counts = {(collection, status): count for collection, status, count in self._conn.execute(
+                "SELECT collection, IFNULL(status, ''), COUNT(*) FROM books GROUP BY 1, 2")}
+            self._boundaries = {}
+            self.version += 1
+
+    # Books in the collection, or only those with this status ("" for books without one).
+    def count(self, collection, status=None):
+        if status is None:
+            return self._counts.get(collection, 0)
+        return self._status_counts.get((collection, status), 0)
+
+    # Books at positions offset .. offset + limit - 1 of the collection in the given order
+    # ("added", "title" or "author"), optionally only those with one status.
+    # Why: With LIMIT/OFFSET SQLite steps over every skipped row, so pages deep in a large
+    # collection got slower the further down they were. The sort keys ending each PAGE_STEP rows
+    # are cached, and a page starts from the nearest one (WHERE (columns) > (key)) down an index,
+    # skipping fewer than PAGE_STEP rows. A change only drops the boundaries at or after the book
+    # it touched.
+    def page(self, collection, offset, limit, order="added", status=None):
+        columns = ", ".join(_SQL_ORDERS[order])
+        where = "collection = ?" if status is None else "collection = ? AND IFNULL(status, '') = ?"
+        params = (collection,) if status is None else (collection, status)
+        after = f" AND ({columns}) > ({', '.join('?' * len(_SQL_ORDERS[order]))})"
+        with self._lock:
+            boundaries = self._boundaries.setdefault((collection, order, status), [])
+            while len(boundaries) < offset // self.PAGE_STEP:
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM books WHERE {where}{after if boundaries else ''} ORDER BY {columns} LIMIT 1 OFFSET ?",
+                    params + (boundaries[-1] if boundaries else ()) + (self.PAGE_STEP - 1,),
+                ).fetchone()
+                if row is None:
+                    break
+                boundaries.append(row)
+            skipped = min(len(boundaries), offset // self.PAGE_STEP)
+            rows = self._conn.execute(
+                f"SELECT id, title, author, status FROM books WHERE {where}{after if skipped else ''} ORDER BY {columns} LIMIT ? OFFSET ?",
+                params + (boundaries[skipped - 1] if skipped else ()) + (limit, offset - skipped * self.PAGE_STEP),
+            ).fetchall()
+        return [_row_to_book(row) for row in rows]
+
+    # Drop the page boundaries a change to this book moves: in every order of its collection, those
+    # at or after its key, in the lists of every book and of the given statuses.
+    def _shift_boundaries(self, collection, book_id, norm_title, norm_author, statuses):
+        keys = {"added": (book_id,), "title": (norm_title, norm_author, book_id), "author": (norm_author, norm_title, book_id)}
+        for (indexed_collection, order, status), boundaries in self._boundaries.items():
+            if indexed_collection == collection and (status is None or status in statuses) and boundaries:
+                del boundaries[bisect.bisect_left(boundaries, keys[order]):]
+
+    def find(self, collection, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, title, author, status FROM books WHERE collection = ? AND norm_title = ? AND norm_author = ? ORDER BY id LIMIT 1",
+                (collection,) + key,
+            ).fetchone()
+        return _row_to_book(row) if row else None
+
+    # Return (collection, book) for a book id, or None.
+    def get(self, book_id):
+        with self._lock:
+            row = self._conn.execute("SELECT collection, id, title, author, status FROM books WHERE id = ?", (book_id,)).fetchone()
+        return (row[0], _row_to_book(row[1:])) if row else None
+
+    # Position of the first book with the same title and author.
+    def index_of(self, collection, book):
+        key = book_key(book["title"], book["author"])
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(id) FROM books WHERE collection = ? AND norm_title = ? AND norm_author = ?",
+                (collection,) + key,
+            ).fetchone()
+            if row[0] is None:
+                return None
+            return self._conn.execute("SELECT COUNT(*) FROM books WHERE collection = ? AND id < ?", (collection, row[0])).fetchone()[0]
+
+    def storage_files(self):
+        return [self._filename]
+
+    # Add a book; a book that already has an id (e.g. during migration) keeps it.
+    def add(self, collection, book):
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO books (id, collection, title, author, status, norm_title, norm_author) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (book.id, collection, book.title, book.author, book.status) + book_key(book.title, book.author),
+            )
+            book.id = cursor.lastrowid
+            self._counts[collection] = self._counts.get(collection, 0) + 1
+            self._count_status(collection, book.status or "", 1)
+            self._shift_boundaries(collection, book.id, *book_key(book.title, book.author), (book.status or "",))
+            self._changed()
+
+    def remove(self, book_id):
+        with self._lock:
+            collection, status, norm_title, norm_author = self._row_of(book_id)
+            self._conn.execute("DELETE FROM books WHERE id = ?", (book_id,))
+            self._counts[collection] -= 1
+            self._count_status(collection, status, -1)
+            self._shift_boundaries(collection, book_id, norm_title, norm_author, (status,))
+            self._changed()
+
+    def update_status(self, book_id, status):
+        with self._lock:
+            collection, old_status, norm_title, norm_author = self._row_of(book_id)
+            self._conn.execute("UPDATE books SET status = ? WHERE id = ?", (status, book_id))
+            self._count_status(collection, old_status, -1)
+            self._count_status(collection, status or "", 1)
+            self._shift_boundaries(collection, book_id, norm_title, norm_author, (old_status, status or ""))
+            self._changed()
+
+    def move(self, book_id, to_collection):
+        with self._lock:
+            collection, status, norm_title, norm_author = self._row_of(book_id)
+            self._conn.execute("UPDATE books SET collection = ? WHERE id = ?", (to_collection, book_id))
+            self._counts[collection] -= 1
+            self._counts[to_collection] = self._counts.get(to_collection, 0) + 1
+            self._count_status(collection, status, -1)
+            self._count_status(to_collection, status, 1)
+            self._shift_boundaries(collection, book_id, norm_title, norm_author, (status,))
+            self._shift_boundaries(to_collection, book_id, norm_title, norm_author, (status,))
+            self._changed()
+
+    # Collection, status ("" for none) and sort key of a book id. Raises KeyError if there is no such book.
+    def _row_of(self, book_id):
+        row = self._conn.execute(
+            "SELECT collection, IFNULL(status, ''), norm_title, norm_author FROM books WHERE id = ?", (book_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(book_id)
+        return row
+
+    def _count_status(self, collection, status, delta):
+        self._status_counts[(collection, status)] = self._status_counts.get((collection, status), 0) + delta
+
+    # Commit all changes made inside the block as one transaction.
+    # Why: If the block fails the transaction is rolled back, unless writes are deferred, in which
+    # case earlier deferred changes share the transaction and the partial batch is kept.
+    @contextlib.contextmanager
+    def batch(self):
+        self._batch_depth += 1
+        try:
+            yield
+        except BaseException:
+            self._batch_depth -= 1
+            if self._batch_depth == 0 and not self.deferred:
+                with self._lock:
+                    self._conn.rollback()
+                    self._dirty = False
+                    self.load()
+            raise
+        self._batch_depth -= 1
+        if self._batch_depth == 0 and not self.deferred:
+            self.flush()
+
+    def save(self):
+        self.flush()
+
+    # Commit the open transaction and make it durable.
+    # Why: In WAL mode the commit is an append to the log with no fsync, so that is all that runs
+    # under the lock page()/get()/find() take on the Tk thread. The fsyncs happen in _sync(), on a
+    # separate connection, so a flush on the write-behind thread doesn't hold up the UI.
+    def flush(self):
+        with self._lock:
+            if self._dirty:
+                self._conn.commit()
+                self._dirty = False
+                self._unsynced = True
+        if self._unsynced:
+            self._sync()
+
+    # Checkpoint the write-ahead log into the database; SQLite fsyncs the log first, so every
+    # committed change is durable once this returns.
+    def _sync(self):
+        with self._sync_lock:
+            if self._sync_conn is None:
+                self._sync_conn = sqlite3.connect(self._filename, check_same_thread=False)
+            self._unsynced = False
+            try:
+                self._sync_conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+            except BaseException:
+                self._unsynced = True
+                raise
+
+    # The checkpoint connection is closed first, so closing the main one (the last connection)
+    # folds the whole log into the database and removes it.
+    def close(self):
+        with self._sync_lock:
+            if self._sync_conn is not None:
+                self._sync_conn.close()
+                self._sync_conn = None
+        with self._lock:
+            if self._conn is not None:
+                self._conn.commit()
+                self._conn.close()
+                self._conn = None
+            self._dirty = self._unsynced = False
+
+    # Bump the version and commit unless a batch is open or writes are deferred.
+    def _changed(self):
+        self.version += 1
+        self._dirty = True
+        if not self._batch_depth and not self.deferred:
+            self.flush()
+
+# Convert a SQLite (id, title, author, status) row into a Book.
+def _row_to_book(row):
+    return Book(row[1], row[2], row[3], row[0])
+
+# Copy an existing books.json (and its journal, if any) into a SQLite database.
+# Why: One-shot migration so switching backends does not lose anyone's library.
+# Refuses to run against a database that already holds books, so it can't import twice. The books
+# go into a temporary database that replaces db_filename only once all of them are in, so a failed
+# migration leaves no empty or half-filled books.db behind to be opened (and trusted) next time.
+def migrate_json_to_sqlite(json_filename="books.json", db_filename="books.db"):
+    if os.path.exists(db_filename):
+        existing = SqliteBackend(db_filename)
+        existing.load()
+        try:
+            if existing.count("my_books") or existing.count("wishlist"):
+                raise ValueError(f"{db_filename} already contains books; not migrating again")
+        finally:
+            existing.close()
+    directory = os.path.dirname(os.path.abspath(db_filename))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(db_filename) + ".", suffix=".tmp")
+    os.close(fd)
+    source = JsonFileBackend(json_filename, journal=True)
+    target = SqliteBackend(tmp_path)
+    try:
+        source.load()
+        target.load()
+        with target.batch():
+            for collection in ("my_books", "wishlist"):
+                for book in source.page(collection, 0, source.count(collection)):
+                    target.add(collection, book)
+        count = target.count("my_books") + target.count("wishlist")
+        target.close()  # Folds the write-ahead log into the file before it is renamed
+        os.replace(tmp_path, db_filename)
+    except BaseException:
+        target.close()
+        for path in (tmp_path, tmp_path + "-wal", tmp_path + "-shm"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        raise
+    finally:
+        source.close()
+    return count
+
+# Goodreads "Exclusive Shelf" values and the status each one maps to.
+GOODREADS_SHELVES = {"read": "Read", "currently-reading": "Reading", "to-read": "To Read"}
+
+# Guess the import/export format from a file name.
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+    raise ValueError(f"Unknown book file format: {path} (expected .csv or .jsonl)")
+
+# Yield books from a CSV file with title/author(/status) columns, or from a Goodreads export.
+# Why: Rows are read one at a time, so a 100k-row file never has to fit in memory.
+def read_books_csv(file):
+    reader = csv.DictReader(file)
+    columns = {name.strip().lower(): name for name in reader.fieldnames or []}
+    title_col = columns.get("title")
+    author_col = columns.get("author")
+    if title_col is None or author_col is None:
+        raise ValueError("CSV file needs 'title' and 'author' columns")
+    status_col = columns.get("status")
+    shelf_col = columns.get("exclusive shelf")
+    for row in reader:
+        title = (row.get(title_col) or "").strip()
+        author = (row.get(author_col) or "").strip()
+        if not title or not author:
+            continue
+        book = {"title": title, "author": author}
+        if status_col and row.get(status_col):
+            book["status"] = row[status_col].strip()
+        elif shelf_col and row.get(shelf_col):
+            shelf = row[shelf_col].strip()
+            book["status"] = GOODREADS_SHELVES.get(shelf, shelf)
+        yield book
+
+# Yield books from a JSON Lines file (one {"title", "author", "status"} object per line).
+def read_books_jsonl(file):
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {number} is not valid JSON: {e}") from None
+        if not isinstance(record, dict):
+            raise ValueError(f"Line {number}: expected a JSON object, got {type(record).__name__}")
+        for field in ("title", "author", "status"):
+            if record.get(field) is not None and not isinstance(record[field], str):
+                raise ValueError(f"Line {number}: {field} must be a string")
+        if not record.get("title") or not record.get("author"):
+            continue
+        book = {"title": record["title"], "author": record["author"]}
+        if record.get("status"):
+            book["status"] = record["status"]
+        yield book
+
+# Import a book file into a collection chunk by chunk.
+# Why: Yields (books added so far, bytes read, file size) after each chunk, so the GUI can
+# update a progress bar between chunks and the headless importer can print progress.
+def iter_import_books(book_collection, path, collection="my_books", fmt=None, chunk_size=1000):
+    fmt = fmt or detect_format(path)
+    size = os.path.getsize(path)
+    added = 0
+    with open(path, "r", encoding="utf-8-sig", newline="") as file:
+        books = read_books_csv(file) if fmt == "csv" else read_books_jsonl(file)
+        while True:
+            chunk = list(itertools.islice(books, chunk_size))
+            if not chunk:
+                break
+            added += book_collection.add_books(collection, chunk)
+            yield added, file.buffer.tell(), size
+    yield added, size, size
+
+# Import a whole book file with a single persist at the end.
+# progress(bytes_read, file_size) is called after each chunk. Returns the number of books added.
+def import_books(book_collection, path, collection="my_books", fmt=None, progress=None, chunk_size=1000):
+    added = 0
+    with book_collection.batch():
+        for added, done, size in iter_import_books(book_collection, path, collection, fmt, chunk_size):
+            if progress is not None:
+                progress(done, size)
+    return added
+
+# Export a collection to a book file chunk by chunk.
+# Why: Books are read from the collection a page at a time and written as they go; yields
+# (books written so far, total books) after each chunk.
+def iter_export_books(book_collection, path, collection="my_books", fmt=None, chunk_size=1000):
+    fmt = fmt or detect_format(path)
+    books = book_collection.my_books if collection == "my_books" else book_collection.wishlist
+    total = len(books)
+    written = 0
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8", newline="") as file:
+            writer = csv.writer(file) if fmt == "csv" else None
+            if writer is not None:
+                writer.writerow(["title", "author", "status"])
+            while written < total:
+                chunk = books[written:written + chunk_size]
+                if not chunk:
+                    break
+                if writer is not None:
+                    writer.writerows([book["title"], book["author"], book.get("status", "")] for book in chunk)
+                else:
+                    file.writelines(json.dumps(book.to_dict(include_id=False)) + "\n" for book in chunk)
+                written += len(chunk)
+                yield written, total
+        os.replace(tmp_path, path)
+    except BaseException:
+        # Also runs when an export is abandoned part-way (GeneratorExit)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    yield written, total
+
+# Export a whole collection to a book file. progress(written, total) is called after each chunk.
+# Returns the number of books written.
+def export_books(book_collection, path, collection="my_books", fmt=None, progress=None, chunk_size=1000):
+    written = 0
+    for written, total in iter_export_books(book_collection, path, collection, fmt, chunk_size):
+        if progress is not None:
+            progress(written, total)
+    return written
+
+# Snapshot files bigger than this are parsed in chunks instead of with one json.load.
+STREAMING_LOAD_THRESHOLD = 8 * 1024 * 1024
+
+# Read a books.json snapshot, parsing large files chunk by chunk.
+# object_hook is passed on to the JSON decoder, as with json.load.
+def _read_snapshot(path, chunk_size=1024 * 1024, object_hook=None):
+    with open(path, "r") as file:
+        if os.fstat(file.fileno()).st_size <= STREAMING_LOAD_THRESHOLD:
+            return json.load(file, object_hook=object_hook)
+        return _ChunkedSnapshotReader(file, chunk_size, object_hook).read()
+
+# Incremental parser for the books.json snapshot layout.
+# Why: json.load needs the whole file as one string next to the parsed objects; this decodes the
+# my_books/wishlist arrays from a buffer of at most a few chunks at a time, so peak memory
+# stays close to the size of the data itself.
+class _ChunkedSnapshotReader:
+    def __init__(self, file, chunk_size, object_hook=None):
+        self._file = file
+        self._chunk_size = chunk_size
+        self._object_hook = object_hook
+        self._decoder = json.JSONDecoder(object_hook=object_hook)
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._batch = True
+
+    def read(self):
+        data = {}
+        self._expect("{")
+        if self._peek() == "}":
+            return data
+        while True:
+            key = self._value()
+            self._expect(":")
+            if key in ("my_books", "wishlist") and self._peek() == "[":
+                data[key] = self._array()
+            else:
+                data[key] = self._value()
+            separator = self._peek()
+            self._pos += 1
+            if separator == "}":
+                return data
+            if separator != ",":
+                raise ValueError(f"Malformed snapshot: expected ',' or '}}', got {separator!r}")
+
+    # Parse a JSON array a buffer at a time.
+    # Why: Every complete book in the buffer is decoded with a single json.loads call, which is
+    # nearly as fast as json.load. A cut that falls inside a string or a nested object (or past the
+    # end of the array) can never parse as a valid array, so after a failed attempt the rest of the
+    # buffer is decoded one element at a time.
+    def _array(self):
+        items = []
+        self._expect("[")
+        if self._peek() == "]":
+            self._pos += 1
+            return items
+        while True:
+            cut = self._buf.rfind("}", self._pos) if self._batch else -1
+            parsed = None
+            if cut > self._pos:
+                try:
+                    parsed = json.loads("[" + self._buf[self._pos:cut + 1] + "]", object_hook=self._object_hook)
+                except json.JSONDecodeError:
+                    self._batch = False
+            if parsed is not None:
+                items.extend(parsed)
+                self._pos = cut + 1
+            else:
+                items.append(self._value())
+            separator = self._peek()
+            self._pos += 1
+            if separator == "]":
+                return items
+            if separator != ",":
+                raise ValueError(f"Malformed snapshot: expected ',' or ']', got {separator!r}")
+
+    # Decode one complete JSON value, reading more of the file if it runs past the buffer.
+    def _value(self):
+        while True:
+            self._peek()
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+                self._fill()
+                continue
+            if end == len(self._buf) and not self._eof:
+                self._fill()  # A number at the end of the buffer may continue in the next chunk
+                continue
+            self._pos = end
+            return value
+
+    def _expect(self, char):
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"Malformed snapshot: expected {char!r}, got {found!r}")
+        self._pos += 1
+
+    # Skip whitespace and return the next character ("" at end of file).
+    def _peek(self):
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buf) or self._eof:
+                return self._buf[self._pos] if self._pos < len(self._buf) else ""
+            self._fill()
+
+    # Drop what has been consumed and append the next chunk of the file.
+    def _fill(self):
+        chunk = self._file.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        self._batch = True
+
+# Write data to path atomically via a temporary file and a rename.
+# Why: A crash mid-write leaves the old file intact instead of a truncated one.
+def _write_atomic(path, data, raw=False):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb" if raw else "w") as file:
+            if raw:
+                file.write(data)
+            else:
+                json.dump(data, file, default=_book_to_json)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+# Open the book collection with the chosen storage backend ("json" or "sqlite").
+# Why: The first time SQLite is chosen, the existing books.json is migrated into books.db.
+# Extra keyword arguments (write_behind, on_error, ...) are passed on to BookCollection.
+def open_collection(storage="json", json_filename="books.json", db_filename="books.db", **options):
+    if storage == "sqlite":
+        # A JSON library may be just a journal until its first compaction
+        if not os.path.exists(db_filename) and (os.path.exists(json_filename) or os.path.exists(json_filename + ".journal")):
+            migrate_json_to_sqlite(json_filename, db_filename)
+        return BookCollection(backend=SqliteBackend(db_filename), reject_duplicates=True, search_index_path=db_filename + ".idx", **options)
+    return BookCollection(json_filename, journal=True, reject_duplicates=True, search_index_path=json_filename + ".idx", **options)
+
+# Directory under which every student's books are kept, relative to the working directory.
+SHARD_ROOT = "students"
+
+# Return the directory of one student's shard: <root>/<2 hex digits>/<student id>.
+# Why: Each student gets their own small files instead of everyone sharing one books.json, and the
+# hash bucket spreads thousands of students over 256 subdirectories so none gets too big.
+# IDs are case-insensitive; anything but letters, digits, '.', '_' and '-' raises ValueError.
+def student_shard_dir(student_id, root=SHARD_ROOT):
+    student_id = student_id.strip().lower()
+    if not re.fullmatch(r"[a-z0-9][a-z0-9._-]{0,63}", student_id):
+        raise ValueError("STUDENT ID may only contain letters, digits, '.', '_' and '-'.")
+    bucket = hashlib.sha1(student_id.encode("utf-8")).hexdigest()[:2]
+    return os.path.join(root, bucket, student_id)
+
+# Open one student's collection, creating their shard directory on first use.
+# Extra keyword arguments are passed on to open_collection/BookCollection.
+def open_student_collection(student_id, storage="json", root=SHARD_ROOT, **options):
+    directory = student_shard_dir(student_id, root)
+    os.makedirs(directory, exist_ok=True)
+    return open_collection(storage, os.path.join(directory, "books.json"), os.path.join(directory, "books.db"), **options)
+
+# Seed student shards from an existing shared books.json (and its journal).
+# Why: The shared file doesn't record who added which book, so every listed student starts with a
+# copy of the shared library and carries on from there. Students that already have a shard are
+# left alone. Returns {student id: books copied, or None if skipped}.
+def split_into_shards(student_ids, source="books.json", root=SHARD_ROOT, storage="json", progress=None):
+    shared = JsonFileBackend(source, journal=True)
+    shared.load()
+    try:
+        libraries = {collection: shared.page(collection, 0, shared.count(collection)) for collection in ("my_books", "wishlist")}
+    finally:
+        shared.close()
+    copied = {}
+    for done, student_id in enumerate(student_ids, 1):
+        directory = student_shard_dir(student_id, root)
+        if os.path.isdir(directory) and os.listdir(directory):
+            copied[student_id] = None
+        else:
+            book_collection = open_student_collection(student_id, storage, root)
+            try:
+                with book_collection.batch():
+                    copied[student_id] = sum(book_collection.add_books(collection, books) for collection, books in libraries.items())
+            finally:
+                book_collection.close()
+        if progress is not None:
+            progress(done, len(student_ids))
+    return copied
+
+# Scrollable list of books that only creates as many rows as fit in the viewport.
+# Why: Widget count and render time stay flat no matter how large the collection is; rows are
+# reused and rebound to different books as the user scrolls.
+class VirtualBookList:
+    ROW_HEIGHT = 34
+
+    # books is any sequence of Books (e.g. a BookListView). actions is a list of
+    # (button text, colour, callback) shown on every row; callback(book_id) gets the id of the
+    # book shown in that row at the moment of the click.
+    def __init__(self, parent, books, actions):
+        self.books = books
+        self._actions = actions
+        self.first = 0  # Index of the book shown in the top row
+        self.rows = []
+        self.frame = tk.Frame(parent, bg="#000")
+        self.viewport = tk.Frame(self.frame, bg="#000")
+        self.viewport.place(x=0, y=0, relwidth=1, relheight=1, width=-18)
+        self.scrollbar = tk.Scrollbar(self.frame, orient="vertical", command=self._on_scrollbar)
+        self.scrollbar.place(relx=1, y=0, relheight=1, width=16, anchor="ne")
+        self.empty_label = tk.Label(self.viewport, text="No books found.", font=("Helvetica", 12), fg="#fff", bg="#000")
+        self.viewport.bind("<Configure>", lambda event: self.refresh())
+        self._bind_wheel(self.viewport)
+
+    # Number of rows that fit in the viewport.
+    def visible_rows(self):
+        return max(1, self.viewport.winfo_height() // self.ROW_HEIGHT)
+
+    # Scroll so that the given book index is the top row.
+    def scroll_to(self, index):
+        self.first = max(0, min(index, len(self.books) - self.visible_rows()))
+        self.refresh()
+
+    # Rebind the visible rows to the books currently in view.
+    # Why: Called after scrolling, resizing or data changes; costs O(visible rows), not O(books).
+    def refresh(self):
+        total = len(self.books)
+        visible = self.visible_rows()
+        while len(self.rows) < visible:
+            self._create_row(len(self.rows))
+        self.first = max(0, min(self.first, total - visible))
+        for i, row in enumerate(self.rows):
+            index = self.first + i
+            if i >= visible or index >= total:
+                row["frame"].place_forget()
+                continue
+            book = self.books[index]
+            status = book.get("status", "N/A")
+            row["label"].config(text=f"{index+1}. {book['title']} by {book['author']} (Status: {status})")
+            row["frame"].place(x=0, y=i * self.ROW_HEIGHT, relwidth=1, height=self.ROW_HEIGHT)
+        if total:
+            self.empty_label.place_forget()
+            self.scrollbar.set(self.first / total, min(1.0, (self.first + visible) / total))
+        else:
+            self.empty_label.place(relx=0.5, y=self.ROW_HEIGHT // 2, anchor="center")
+            self.scrollbar.set(0, 1)
+
+    # A book was inserted at index; keep the rows on screen showing the same books.
+    # index is None when the position isn't known; the visible rows are simply rebound.
+    def on_insert(self, index):
+        if index is not None and index < self.first:
+            self.first += 1
+        self._refresh_if_affected(index)
+
+    # A book was removed from index; shift the window if the removal happened above it.
+    def on_remove(self, index):
+        if index is not None and index < self.first:
+            self.first -= 1
+        self._refresh_if_affected(index)
+
+    # The book at index changed in place; only redraw if it is on screen.
+    def on_update(self, index):
+        if index is None or self.first <= index < self.first + self.visible_rows():
+            self.refresh()
+
+    # Rows only need rebinding if the change landed in (or above the bottom of) the visible window.
+    def _refresh_if_affected(self, index):
+        if index is None or index < self.first + self.visible_rows():
+            self.refresh()
+        else:
+            total = len(self.books)
+            self.scrollbar.set(self.first / total if total else 0, min(1.0, (self.first + self.visible_rows()) / total) if total else 1)
+
+    # Create one reusable row; its buttons look up the book in the row at click time and pass on its id.
+    def _create_row(self, position):
+        frame = tk.Frame(self.viewport, bg="#000")
+        label = tk.Label(frame, font=("Helvetica", 12), fg="#fff", bg="#000", anchor="w")
+        label.place(x=0, rely=0.5, relwidth=0.98 - 0.16 * len(self._actions), anchor="w")
+        widgets = [frame, label]
+        for i, (text, colour, callback) in enumerate(self._actions):
+            button = tk.Button(frame, text=text, command=lambda callback=callback: self._click(position, callback), font=("Helvetica", 10), bg=colour, fg="white")
+            button.place(relx=1 - 0.16 * (len(self._actions) - i) + 0.08, rely=0.5, anchor="center")
+            widgets.append(button)
+        for widget in widgets:
+            self._bind_wheel(widget)
+        self.rows.append({"frame": frame, "label": label})
+
+    def _click(self, position, callback):
+        index = self.first + position
+        if index < len(self.books):
+            callback(self.books[index].id)
+
+    def _bind_wheel(self, widget):
+        widget.bind("<MouseWheel>", lambda event: self._scroll_by(-1 if event.delta > 0 else 1) or "break")
+        widget.bind("<Button-4>", lambda event: self._scroll_by(-1) or "break")
+        widget.bind("<Button-5>", lambda event: self._scroll_by(1) or "break")
+
+    def _scroll_by(self, rows):
+        self.scroll_to(self.first + rows * 3)
+
+    # Handle the scrollbar's "moveto fraction" and "scroll n units/pages" commands.
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(value) * len(self.books)))
+        elif action == "scroll":
+            step = self.visible_rows() if unit == "pages" else 1
+            self.scroll_to(self.first + int(value) * step)
+
+# Keeps each screen's widgets alive and switches screens by hiding and showing them.
+# Why: Screens are built once on first visit instead of being destroyed and rebuilt on every
+# navigation, which removes the flicker and the rebuild cost.
+class ScreenManager:
+    def __init__(self):
+        self._screens = {}
+        self.current = None
+
+    # Register a screen. build() returns its widgets, layout() places them, and the optional
+    # on_show() runs every time the screen becomes visible.
+    def register(self, name, build, layout, on_show=None):
+        self._screens[name] = {"build": build, "layout": layout, "on_show": on_show, "widgets": None}
+
+    # Return the widgets of a screen, building it if needed.
+    def widgets(self, name):
+        screen = self._screens[name]
+        if screen["widgets"] is None:
+            with instrumentation.span("screen.build:" + name):
+                screen["widgets"] = screen["build"]()
+        return screen["widgets"]
+
+    # Hide the current screen and show the named one.
+    def show(self, name):
+        with instrumentation.span("screen.show:" + name), instrumentation.profile(name):
+            if self.current is not None and self.current != name:
+                for widget in self.widgets(self.current):
+                    widget.place_forget()
+            self.widgets(name)
+            self.current = name
+            screen = self._screens[name]
+            if screen["on_show"] is not None:
+                screen["on_show"]()
+            screen["layout"]()
+
+    # Destroy a screen's widgets; it is built again the next time it is shown.
+    # Why: Lets screens that hold one user's data be dropped at logout.
+    def discard(self, name):
+        screen = self._screens[name]
+        if screen["widgets"] is not None:
+            for widget in screen["widgets"]:
+                widget.destroy()
+            screen["widgets"] = None
+        if self.current == name:
+            self.current = None
+
+    # Re-run the layout of the visible screen, e.g. after the window was resized.
+    def reposition(self):
+        if self.current is not None:
+            self._screens[self.current]["layout"]()
+
+# Renders the window background from a source image without blocking the Tk main thread.
+# Why: A full-resolution LANCZOS resize takes long enough to freeze the UI, so it runs on a worker
+# thread from a pre-downscaled mipmap, finished backgrounds are kept in a small LRU cache keyed by
+# window size, and a cheap preview covers the window while the user is still dragging.
+class BackgroundRenderer:
+    # make_photo turns a PIL image into something Tk can display (ImageTk.PhotoImage); it is only
+    # ever called on the main thread, from preview() and poll().
+    def __init__(self, source, make_photo, cache_size=6, max_size=(2560, 1600)):
+        self._source = source
+        self._make_photo = make_photo
+        self._cache_size = cache_size
+        self._max_size = max_size
+        self._cache = collections.OrderedDict()  # (w, h) -> photo, least recently used first
+        self._mipmaps = None  # Built on the worker thread on first use
+        self._condition = threading.Condition()
+        self._job = None  # (generation, size) waiting for the worker
+        self._generation = 0
+        self._busy = False  # True while the worker is rendering
+        self._results = []  # (size, PIL image) finished by the worker
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    # True while a high-quality render is queued, running or waiting to be polled.
+    @property
+    def pending(self):
+        with self._condition:
+            return self._job is not None or self._busy or bool(self._results)
+
+    # Return the cached background for this size, or None.
+    def get(self, size):
+        photo = self._cache.get(size)
+        if photo is not None:
+            self._cache.move_to_end(size)
+        return photo
+
+    # Return a quick low-quality background for this size, or None if the mipmap isn't ready yet.
+    def preview(self, size):
+        mipmaps = self._mipmaps
+        if mipmaps is None:
+            return None
+        w, h = size
+        level = _pick_mipmap(mipmaps, (max(1, w // 2), max(1, h // 2)))
+        from PIL import Image
+        return self._make_photo(_cover_crop(level, size, Image.Resampling.BILINEAR))
+
+    # Queue a high-quality render for this size, replacing any job that hasn't started yet.
+    # Why: Only the latest window size matters; a render already in progress is discarded when done.
+    def request(self, size):
+        with self._condition:
+            self._generation += 1
+            self._job = (self._generation, size)
+            self._condition.notify()
+
+    # Convert finished renders into photos on the main thread and cache them.
+    # Returns a list of (size, photo) pairs that are ready to show.
+    def poll(self):
+        with self._condition:
+            results, self._results = self._results, []
+        ready = []
+        for size, image in results:
+            photo = self._make_photo(image)
+            self._store(size, photo)
+            ready.append((size, photo))
+        return ready
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._job = None
+            self._condition.notify()
+
+    def _store(self, size, photo):
+        self._cache[size] = photo
+        self._cache.move_to_end(size)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    # Worker loop: always render the newest requested size.
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._job is None and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                generation, size = self._job
+                self._job = None
+                self._busy = True
+            try:
+                from PIL import Image
+                with instrumentation.span("background.render"):
+                    if self._mipmaps is None:
+                        self._mipmaps = _build_mipmaps(self._source, self._max_size)
+                    image = _cover_crop(_pick_mipmap(self._mipmaps, size), size, Image.Resampling.LANCZOS)
+            except Exception as e:
+                print(f"Error resizing background image: {e}")
+                image = None
+            with self._condition:
+                self._busy = False
+                if image is not None and generation == self._generation:
+                    self._results.append((size, image))
+
+# Build a chain of progressively halved copies of the source image.
+# Why: Resampling from the smallest copy that still covers the window is much cheaper than
+# resampling from full resolution every time.
+def _build_mipmaps(source, max_size):
+    level = source.convert("RGB")
+    factor = int(min(level.width / max_size[0], level.height / max_size[1]))
+    if factor >= 2:
+        level = level.reduce(factor)
+    mipmaps = [level]
+    while level.width >= 128 and level.height >= 128:
+        level = level.reduce(2)
+        mipmaps.append(level)
+    return mipmaps
+
+# Return the smallest mipmap level that still covers size, or the largest one if none does.
+def _pick_mipmap(mipmaps, size):
+    w, h = size
+    for level in reversed(mipmaps):
+        if level.width >= w and level.height >= h:
+            return level
+    return mipmaps[0]
+
+# Scale image to cover size, preserving aspect ratio, and crop the overflow from the centre.
+def _cover_crop(image, size, resample):
+    w, h = size
+    img_w, img_h = image.size
+    scale = max(w / img_w, h / img_h)
+    new_size = (max(w, int(img_w * scale)), max(h, int(img_h * scale)))
+    resized = image.resize(new_size, resample)
+    left = (resized.width - w) // 2
+    top = (resized.height - h) // 2
+    return resized.crop((left, top, left + w, top + h))
+
+# Records how long the phases of startup take, measured from when main.py started importing.
+# Why: Cold start time creeps up as features are added; reporting it makes regressions visible.
+class StartupTimer:
+    def __init__(self, started=None):
+        self.started = _PROCESS_STARTED if started is None else started
+        self.marks = {}
+        self._lock = threading.Lock()
+
+    # Record that a phase finished now. Safe to call from any thread; only the first mark counts.
+    def mark(self, name):
+        with self._lock:
+            self.marks.setdefault(name, (time.perf_counter() - self.started) * 1000)
+
+    # One-line summary, e.g. "startup: window 41ms, first_frame 63ms, data_loaded 220ms".
+    def summary(self):
+        with self._lock:
+            marks = sorted(self.marks.items(), key=lambda item: item[1])
+        return "startup: " + ", ".join(f"{name} {ms:.0f}ms" for name, ms in marks)
+
+    # Print the summary to stderr and, if log_path is given, append the marks as a JSON line.
+    def report(self, log_path=None):
+        print(self.summary(), file=sys.stderr)
+        if log_path:
+            with self._lock:
+                record = {"time": time.time(), "marks_ms": {name: round(ms, 1) for name, ms in self.marks.items()}}
+            with open(log_path, "a") as file:
+                file.write(json.dumps(record) + "\n")
+
+# Upper bounds (ms) of the histogram buckets in the instrumentation summary; the last is open-ended.
+SPAN_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# Timing spans for the hot paths (storage, screen builds, resizing, Tk callbacks), off by default.
+# Why: When the app "freezes" this tells whether the time went to saving, to building a screen or to
+# rendering the background. While disabled, span() hands back a shared no-op context manager, so the
+# instrumented code pays one method call. When enabled, the last `window` durations of every span
+# name are kept for a rolling histogram, and trace_path (if given) receives every span as a Chrome
+# trace event file that chrome://tracing, Perfetto or speedscope can open.
+# profile_screen names a screen ("home", "view:my_books", ...) whose next show is run under cProfile.
+class Instrumentation:
+    def __init__(self):
+        self.enabled = False
+        self._trace_path = None
+        self._trace_file = None
+        self._trace_pending = []
+        self._trace_threads = set()
+        self._window = 2048
+        self._durations = {}  # Span name -> deque of the most recent durations in seconds
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._profile_screen = None
+        self._profile_path = None
+        self._original_call_wrapper = None
+        self._lag_interval = None
+
+    # Turn the spans on. Also wraps every Tk callback in a span, if tkinter allows it.
+    def enable(self, trace_path=None, window=2048):
+        with self._lock:
+            self.enabled = True
+            self._window = window
+            self._trace_path = trace_path
+        self._wrap_tk_callbacks()
+
+    # Run the next show of this screen under cProfile and save the stats to path
+    # (default "profile-<screen>.prof"). Works with or without the spans enabled.
+    def profile_screen(self, name, path=None):
+        self._profile_screen = name
+        self._profile_path = path or "profile-" + re.sub(r"[^\w.-]", "_", name) + ".prof"
+
+    def span(self, name):
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, name)
+
+    # Record a finished span that started at `start` (time.perf_counter()) and took `duration` seconds.
+    def record(self, name, start, duration):
+        if not self.enabled:
+            return
+        with self._lock:
+            durations = self._durations.get(name)
+            if durations is None:
+                durations = self._durations[name] = collections.deque(maxlen=self._window)
+            durations.append(duration)
+            if self._trace_path is not None:
+                thread = threading.current_thread()
+                if thread.ident not in self._trace_threads:
+                    self._trace_threads.add(thread.ident)
+                    self._trace_pending.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": thread.ident,
+                                                "args": {"name": thread.name}})
+                self._trace_pending.append({"name": name, "ph": "X", "pid": os.getpid(), "tid": thread.ident,
+                                            "ts": round((start - self._started) * 1e6), "dur": round(duration * 1e6)})
+                if len(self._trace_pending) >= 1000:
+                    self._write_trace()
+
+    # Context manager that profiles the block if `screen` is the screen picked by profile_screen().
+    @contextlib.contextmanager
+    def profile(self, screen):
+        if screen != self._profile_screen:
+            yield
+            return
+        self._profile_screen = None  # Only the first show is profiled
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(self._profile_path)
+            print(f"Profile of '{screen}' saved to {self._profile_path}", file=sys.stderr)
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(20)
+
+    # Measure how late the Tk event loop runs a timer, every interval_ms, as the "tk.loop_lag" span.
+    # Why: A late timer means some callback (or a blocking call inside one) kept the mainloop busy.
+    def watch_event_loop(self, root, interval_ms=50):
+        if not self.enabled or self._lag_interval is not None:
+            return
+        self._lag_interval = interval_ms / 1000
+
+        def _loop_lag_tick(expected):
+            now = time.perf_counter()
+            lag = max(0.0, now - expected)
+            self.record("tk.loop_lag", expected, lag)
+            if self.enabled:
+                root.after(interval_ms, _loop_lag_tick, time.perf_counter() + self._lag_interval)
+
+        root.after(interval_ms, _loop_lag_tick, time.perf_counter() + self._lag_interval)
+
+    # Per span name: count, p50/p95/max in ms and bucket counts over the rolling window.
+    def summary(self):
+        with self._lock:
+            snapshot = {name: sorted(durations) for name, durations in self._durations.items()}
+        summary = {}
+        for name, durations in sorted(snapshot.items()):
+            buckets = [0] * (len(SPAN_BUCKETS_MS) + 1)
+            for duration in durations:
+                buckets[bisect.bisect_left(SPAN_BUCKETS_MS, duration * 1000)] += 1
+            summary[name] = {
+                "count": len(durations),
+                "p50_ms": durations[len(durations) // 2] * 1000,
+                "p95_ms": durations[min(len(durations) - 1, len(durations) * 95 // 100)] * 1000,
+                "max_ms": durations[-1] * 1000,
+                "buckets": buckets,
+            }
+        return summary
+
+    # Text table of summary(): one line per span, with the histogram as "<=bound:count" pairs.
+    def report(self):
+        lines = [f"{'span':<44}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}  histogram (ms)"]
+        for name, stats in self.summary().items():
+            bounds = [f"<={bound}" for bound in SPAN_BUCKETS_MS] + [f">{SPAN_BUCKETS_MS[-1]}"]
+            histogram = " ".join(f"{bound}:{count}" for bound, count in zip(bounds, stats["buckets"]) if count)
+            lines.append(f"{name:<44}{stats['count']:>7}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['max_ms']:>10.2f}  {histogram}")
+        return "\n".join(lines)
+
+    # Print the report to stderr, finish the trace file and stop recording.
+    def close(self):
+        if not self.enabled:
+            return
+        print(self.report(), file=sys.stderr)
+        with self._lock:
+            self.enabled = False
+            if self._trace_path is not None:
+                self._write_trace()
+                if self._trace_file is not None:
+                    self._trace_file.write("\n]\n")
+                    self._trace_file.close()
+                    self._trace_file = None
+                    print(f"Trace written to {self._trace_path}", file=sys.stderr)
+        self._unwrap_tk_callbacks()
+
+    # Append the pending events to the trace file (a JSON array of trace events). Caller holds _lock.
+    def _write_trace(self):
+        if not self._trace_pending:
+            return
+        if self._trace_file is None:
+            self._trace_file = open(self._trace_path, "w")
+            self._trace_file.write("[\n")
         else:
-            self._wishlist.pop(index)
-        self.save_data()
+            self._trace_file.write(",\n")
+        self._trace_file.write(",\n".join(json.dumps(event) for event in self._trace_pending))
+        self._trace_file.flush()
+        self._trace_pending = []
+
+    # Route every Tk -> Python callback (commands, bindings, after() timers) through a span.
+    # Why: tkinter calls all of them through CallWrapper, so one wrapper covers every callback
+    # without touching each widget; the loop-lag timer itself is left out.
+    def _wrap_tk_callbacks(self):
+        call_wrapper = getattr(tk, "CallWrapper", None)
+        if call_wrapper is None or self._original_call_wrapper is not None:
+            return
+        original = self._original_call_wrapper = call_wrapper.__call__
+
+        def __call__(wrapper, *args):
+            if not self.enabled:
+                return original(wrapper, *args)
+            func = wrapper.func
+            name = getattr(func, "__qualname__", "")
+            if name.endswith("callit"):
+                name = getattr(func, "__name__", name)  # after() wraps the timer in callit but keeps its __name__
+            if name == "_loop_lag_tick":
+                return original(wrapper, *args)
+            start = time.perf_counter()
+            try:
+                return original(wrapper, *args)
+            finally:
+                self.record("tk.callback:" + name, start, time.perf_counter() - start)
+
+        call_wrapper.__call__ = __call__
+
+    def _unwrap_tk_callbacks(self):
+        if self._original_call_wrapper is not None:
+            tk.CallWrapper.__call__ = self._original_call_wrapper
+            self._original_call_wrapper = None
+
+# One timing span; see Instrumentation.span.
+class _Span:
+    __slots__ = ("_instrumentation", "_name", "_start")
+
+    def __init__(self, instrumentation, name):
+        self._instrumentation = instrumentation
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._instrumentation.record(self._name, self._start, time.perf_counter() - self._start)
+        return False
+
+_NO_SPAN = contextlib.nullcontext()
+
+# The app-wide instrumentation; main() enables it from the command line or the environment.
+instrumentation = Instrumentation()
+
+DEFAULT_VIEW_MODE = ("added", None)  # (sort order, status filter) a list screen starts with
 
 # Main application class for the Book Tracker GUI.
 # Why: Handles all user interface logic, keeping it separate from data management for clarity and maintainability.
 class BookTrackerApp:
     # Initialize the main app window and layout.
     # Why: Sets up the main window and prepares the UI for user interaction.
-    def __init__(self, root):
+    # Nothing is loaded until a student logs in; their own shard under shard_root is then opened
+    # on a background thread (see open_student_collection). The background image loads after the
+    # first frame, so the login screen paints straight away. Pass a StartupTimer to record how long
+    # each of those phases took; with report_startup=True the timings are printed (and appended to
+    # startup_log, if given) once the first frame and the background are both ready.
+    def __init__(self, root, storage="json", startup_timer=None, report_startup=False, startup_log=None, shard_root=SHARD_ROOT):
         self.root = root
         self.root.title("Book Tracker")
         self.root.minsize(800, 600)
         self.root.configure(bg="#000000")  # Set window background to black
-        self.collection = BookCollection()
+        self.startup_timer = startup_timer or StartupTimer()
+        self._startup_report = (report_startup, startup_log)
+        self._storage = storage
+        self._shard_root = shard_root
+        self.student_id = None
+        self.collection = None  # The logged-in student's BookCollection
         self._resize_after_id = None  # For debouncing resize events
+        self._preview_after_id = None  # For throttling the low-quality preview while dragging
+        self._bg_poll_after_id = None  # Polls the renderer while a high-quality render is pending
+        self._login_pending = False  # Login clicked while the collection was still loading
+        self.bg_photo = None
         
-        # Load the original background image
+        self.book_lists = {}
+        self._bulk_job = None  # Import/export generator currently being driven by the event loop
+        self._search_queries = {}  # Collection -> text in its search box
+        self._search_after_ids = {}  # Collection -> pending debounced search
+        self._view_modes = {}  # Collection -> (sort order, status filter) of its list screen
+        self.screens = ScreenManager()
+        self.screens.register("login", self._build_login_screen, self._reposition_login_widgets, self._on_show_login_screen)
+        self.screens.register("home", self._build_home_screen, self._reposition_home_widgets, self._refresh_home_stats)
+        for collection in ("my_books", "wishlist"):
+            self.screens.register(f"add:{collection}", lambda c=collection: self._build_add_screen(c), self._reposition_add_widgets, lambda c=collection: self._on_show_add_screen(c))
+            self.screens.register(f"view:{collection}", lambda c=collection: self._build_view_screen(c), lambda c=collection: self._reposition_view_widgets(c))
+        self.root.bind('<Configure>', self._on_resize)  # Bind only once here
+        self.root.protocol("WM_DELETE_WINDOW", self.exit_app)
+        self.show_login_screen()
+        self.startup_timer.mark("login_screen")
+        self.root.after_idle(self._after_first_frame)
+        instrumentation.watch_event_loop(self.root)
+
+    # Runs once the login screen has been drawn: record the time and start loading the background.
+    def _after_first_frame(self):
+        self.startup_timer.mark("first_frame")
+        self._load_background()
+        self._report_startup_if_done()
+
+    # Load the original background image. PIL is imported here rather than at startup, and the
+    # decode and resize run on the BackgroundRenderer's worker thread.
+    def _load_background(self):
         try:
+            from PIL import Image, ImageTk
             self.bg_image_original = Image.open("teeee.jpg")
-            self.bg_photo = None
+            self.bg_renderer = BackgroundRenderer(self.bg_image_original, ImageTk.PhotoImage)
             self.bg_label = tk.Label(self.root)
             self.bg_label.place(x=0, y=0, relwidth=1, relheight=1)
             self.bg_label.lower()  # Place it behind other widgets
-            self._resize_bg_image()  # Initial resize
+            self._resize_bg_image()  # Initial render
         except Exception as e:
             print(f"Error loading background image: {e}")
-        
-        self.current_widgets = []
-        self.root.bind('<Configure>', self._on_resize)  # Bind only once here
-        self.show_login_screen()
+
+    # Open the student's shard and log them in once it has loaded on its background thread.
+    def log_in(self, student_id):
+        try:
+            self.collection = open_student_collection(student_id, self._storage, self._shard_root, write_behind=True,
+                                                      on_error=self._report_save_error, search=True, background_load=True, stats=True,
+                                                      sort_indexes=True)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.student_id = student_id
+        self.collection.subscribe(self._on_collection_change)
+        self._login_pending = True
+        self.login_widgets[5].config(text="Loading...", state="disabled")
+        self._watch_collection_load()
+
+    # Poll the shard's background load so a waiting login can continue (and the load time is
+    # recorded) without blocking the event loop.
+    def _watch_collection_load(self):
+        if self.collection is None or not self._login_pending:
+            return
+        if not self.collection.is_loaded():
+            self.root.after(25, self._watch_collection_load)
+            return
+        self.startup_timer.mark("data_loaded")
+        self._login_pending = False
+        self.login_widgets[5].config(text="Login", state="normal")
+        self._finish_login()
+
+    # Report startup timings once, when everything loaded in the background has arrived.
+    def _report_startup_if_done(self):
+        enabled, log_path = self._startup_report
+        marks = self.startup_timer.marks
+        if not enabled or "first_frame" not in marks:
+            return
+        if "background" not in marks and hasattr(self, 'bg_renderer'):
+            return
+        self._startup_report = (False, None)
+        try:
+            self.startup_timer.report(log_path)
+        except OSError as e:
+            print(f"Error writing startup log: {e}")
+
+    # Enter the app once the collection is available.
+    def _finish_login(self):
+        try:
+            self.collection.wait_until_loaded()
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not load your books: {e}")
+            self._release_collection()
+            return
+        messagebox.showinfo("Login Successful", "Welcome!")
+        self.show_home()
+
+    # Flush queued saves and leave the main loop.
+    # Why: The Exit buttons and the window close button all come through here, so the
+    # write-behind queue is always drained before the app stops.
+    def exit_app(self):
+        self._release_collection()
+        self.root.quit()
+
+    # Called from the write-behind thread when a save fails; shows the error on the Tk thread.
+    def _report_save_error(self, error):
+        self.root.after(0, lambda: messagebox.showerror("Save Error", f"Could not save your books: {error}"))
 
     def _on_resize(self, event=None):
+        if event is not None and event.widget is not self.root:
+            return  # Child widgets report <Configure> through the toplevel binding too
+        if self._preview_after_id is None and hasattr(self, 'bg_renderer'):
+            self._preview_after_id = self.root.after(30, self._preview_bg_image)
         if self._resize_after_id:
             self.root.after_cancel(self._resize_after_id)
         self._resize_after_id = self.root.after(100, self._do_resize)
 
     def _do_resize(self):
-        self._resize_bg_image()
-        if hasattr(self, '_reposition_login_widgets') and hasattr(self, 'login_widgets') and self.login_widgets:
-            self._reposition_login_widgets()
-        if hasattr(self, '_reposition_home_widgets') and hasattr(self, 'home_widgets') and self.home_widgets:
-            self._reposition_home_widgets()
-        if hasattr(self, '_reposition_add_widgets') and hasattr(self, 'add_widgets') and self.add_widgets:
-            self._reposition_add_widgets()
+        with instrumentation.span("resize.bg_image"):
+            self._resize_bg_image()
+        with instrumentation.span("resize.reposition"):
+            self.screens.reposition()
         self._resize_after_id = None
 
+    # Cover the window with a cached or low-quality background while it is being resized.
+    def _preview_bg_image(self):
+        self._preview_after_id = None
+        size = self._window_size()
+        if size is None or size == self._bg_size():
+            return
+        with instrumentation.span("resize.preview"):
+            photo = self.bg_renderer.get(size) or self.bg_renderer.preview(size)
+        if photo is not None:
+            self._show_bg_photo(photo)
+
+    # Show the high-quality background for the current window size.
+    # Why: Sizes seen before come straight from the cache; anything else is rendered on the
+    # renderer's worker thread and swapped in by _poll_bg_image when ready.
     def _resize_bg_image(self, event=None):
-        if not hasattr(self, 'bg_image_original'):
+        if not hasattr(self, 'bg_renderer'):
             return
-        w = self.root.winfo_width()
-        h = self.root.winfo_height()
-        if w < 2 or h < 2:
+        size = self._window_size()
+        if size is None:
             return
+        photo = self.bg_renderer.get(size)
+        if photo is not None:
+            self._show_bg_photo(photo)
+            return
+        self.bg_renderer.request(size)
+        if self._bg_poll_after_id is None:
+            self._bg_poll_after_id = self.root.after(20, self._poll_bg_image)
 
-        # Calculate the new size preserving aspect ratio and cropping
-        img_w, img_h = self.bg_image_original.size
-        scale = max(w / img_w, h / img_h)
-        new_size = (int(img_w * scale), int(img_h * scale))
-        resized = self.bg_image_original.resize(new_size, Image.Resampling.LANCZOS)
-
-        # Crop to fit the window exactly
-        left = (resized.width - w) // 2
-        top = (resized.height - h) // 2
-        right = left + w
-        bottom = top + h
-        cropped = resized.crop((left, top, right, bottom))
+    def _poll_bg_image(self):
+        self._bg_poll_after_id = None
+        size = self._window_size()
+        for rendered_size, photo in self.bg_renderer.poll():
+            if rendered_size == size:
+                self._show_bg_photo(photo)
+        if self.bg_renderer.pending:
+            self._bg_poll_after_id = self.root.after(20, self._poll_bg_image)
 
-        self.bg_photo = ImageTk.PhotoImage(cropped)
+    def _show_bg_photo(self, photo):
+        self.bg_photo = photo
         self.bg_label.config(image=self.bg_photo)
-        self.bg_label.place(x=0, y=0, relwidth=1, relheight=1)
+        if "background" not in self.startup_timer.marks:
+            self.startup_timer.mark("background")
+            self._report_startup_if_done()
 
-    def clear_widgets(self):
-        for widget in self.root.winfo_children():
-            if widget != self.bg_label:  # Don't destroy the background
-                widget.destroy()
-        self.current_widgets = []
+    # Size of the background currently shown, or None.
+    def _bg_size(self):
+        if self.bg_photo is None:
+            return None
+        return (self.bg_photo.width(), self.bg_photo.height())
+
+    def _window_size(self):
+        w = self.root.winfo_width()
+        h = self.root.winfo_height()
+        if w < 2 or h < 2:
+            return None
+        return (w, h)
 
     # Show the login screen in the main frame
     def show_login_screen(self):
-        self.clear_widgets()
+        self.screens.show("login")
+
+    # Build the login screen widgets once; the screen manager shows and hides them afterwards.
+    def _build_login_screen(self):
         self.login_widgets = []
         
         # Place widgets directly on the background for a cleaner look
@@ -199,8 +3005,12 @@ class BookTrackerApp:
         self.login_widgets.append(password_entry)
         
         def validate_login():
-            messagebox.showinfo("Login Successful", "Welcome!")
-            self.show_home()
+            student_id = username_entry.get().strip()
+            if not student_id:
+                messagebox.showerror("Error", "Please enter your STUDENT ID.")
+                return
+            if self.collection is None:
+                self.log_in(student_id)
             
         button_style = {
             "font": ("Helvetica", 14, "bold"),
@@ -212,32 +3022,23 @@ class BookTrackerApp:
         }
         
         login_button = tk.Button(self.root, text="Login", command=validate_login, bg="#FF5733", fg="white", activebackground="#C63D0F", activeforeground="white", **button_style)
-        exit_button = tk.Button(self.root, text="Exit", command=self.root.quit, bg="#f44336", fg="white", activebackground="#b71c1c", activeforeground="white", **button_style)
+        exit_button = tk.Button(self.root, text="Exit", command=self.exit_app, bg="#f44336", fg="white", activebackground="#b71c1c", activeforeground="white", **button_style)
         
         self.login_widgets.append(login_button)
         self.login_widgets.append(exit_button)
-        
-        # Place widgets using place for custom layout
-        w = self.root.winfo_width() if self.root.winfo_width() > 1 else 800
-        h = self.root.winfo_height() if self.root.winfo_height() > 1 else 600
-        y = h // 2 - 120
-        spacing = 45
-        title_label.place(x=w//2, y=y, anchor="center")
-        username_label.place(x=w//2, y=y+spacing*1, anchor="center")
-        username_entry.place(x=w//2, y=y+spacing*2, anchor="center", width=220)
-        password_label.place(x=w//2, y=y+spacing*3, anchor="center")
-        password_entry.place(x=w//2, y=y+spacing*4, anchor="center", width=220)
-        login_button.place(x=w//2, y=y+spacing*5+10, anchor="center")
-        exit_button.place(x=w//2, y=y+spacing*6+10, anchor="center")
-        
-        self.current_widgets = self.login_widgets
-        self.root.update()
+        return self.login_widgets
+
+    # Clear the credentials each time the login screen is shown.
+    # Why: The cached screen would otherwise still hold the previous user's ID and password after logout.
+    def _on_show_login_screen(self):
+        self.login_widgets[2].delete(0, tk.END)
+        self.login_widgets[4].delete(0, tk.END)
 
     def _reposition_login_widgets(self, event=None):
         if not hasattr(self, 'login_widgets') or not self.login_widgets:
             return
-        w = self.root.winfo_width()
-        h = self.root.winfo_height()
+        w = self.root.winfo_width() if self.root.winfo_width() > 1 else 800
+        h = self.root.winfo_height() if self.root.winfo_height() > 1 else 600
         y = h // 2 - 120
         spacing = 45
         self.login_widgets[0].place(x=w//2, y=y, anchor="center")
@@ -251,7 +3052,10 @@ class BookTrackerApp:
     # Show the home screen with navigation buttons.
     # Why: Provides the main navigation for the app, letting users choose what to do next.
     def show_home(self):
-        self.clear_widgets()
+        self.screens.show("home")
+
+    # Build the home screen widgets once.
+    def _build_home_screen(self):
         self.home_widgets = []
         
         # Place widgets directly on the background for a cleaner look
@@ -269,30 +3073,32 @@ class BookTrackerApp:
         view_books_btn = tk.Button(self.root, text="View My Books", command=lambda: self.view_books_gui("my_books"), bg="#4CAF50", fg="white", activebackground="#388E3C", activeforeground="white", **button_style)
         view_wishlist_btn = tk.Button(self.root, text="View Wishlist", command=lambda: self.view_books_gui("wishlist"), bg="#4CAF50", fg="white", activebackground="#388E3C", activeforeground="white", **button_style)
         logout_btn = tk.Button(self.root, text="Log Out", command=self.logout, bg="#9E9E9E", fg="white", activebackground="#616161", activeforeground="white", **button_style)
-        exit_btn = tk.Button(self.root, text="Exit", command=self.root.quit, bg="#f44336", fg="white", activebackground="#b71c1c", activeforeground="white", **button_style)
-        self.home_widgets.extend([add_btn, view_books_btn, view_wishlist_btn, logout_btn, exit_btn])
-        
-        # Place widgets using place for custom layout
-        w = self.root.winfo_width() if self.root.winfo_width() > 1 else 800
-        h = self.root.winfo_height() if self.root.winfo_height() > 1 else 600
-        y = h // 2 - 180
-        spacing = 70
-        title_label.place(x=w//2, y=y, anchor="center")
-        add_btn.place(x=w//2, y=y+spacing*1, anchor="center")
-        view_books_btn.place(x=w//2, y=y+spacing*2, anchor="center")
-        view_wishlist_btn.place(x=w//2, y=y+spacing*3, anchor="center")
-        logout_btn.place(x=w//2, y=y+spacing*4, anchor="center")
-        exit_btn.place(x=w//2, y=y+spacing*5, anchor="center")
-        
-        self.current_widgets = self.home_widgets
-        self.root.update()
+        exit_btn = tk.Button(self.root, text="Exit", command=self.exit_app, bg="#f44336", fg="white", activebackground="#b71c1c", activeforeground="white", **button_style)
+        stats_label = tk.Label(self.root, font=("Helvetica", 12), fg="#fff", bg="#000000", justify="center")
+        self.home_widgets.extend([add_btn, view_books_btn, view_wishlist_btn, logout_btn, exit_btn, stats_label])
+        return self.home_widgets
+
+    # Show the library's totals, status counts and top authors under the home buttons.
+    # Why: Read from the collection's running counters, so this costs the same for any library size.
+    def _refresh_home_stats(self):
+        if self.collection is None:
+            return
+        stats = self.collection.stats()
+        statuses = stats.by_status("my_books")
+        parts = [f"{status} {statuses.pop(status)}" for status in BOOK_STATUSES if status in statuses]
+        parts += [f"{status or 'No status'} {count}" for status, count in sorted(statuses.items(), key=lambda item: item[0] or "")]
+        lines = [f"My Books: {stats.total('my_books')}" + (f" ({' · '.join(parts)})" if parts else "") + f"   Wishlist: {stats.total('wishlist')}"]
+        authors = stats.top_authors("my_books", 3)
+        if authors:
+            lines.append("Top authors: " + " · ".join(f"{author} ({count})" for author, count in authors))
+        self.screens.widgets("home")[6].config(text="\n".join(lines))
 
     def _reposition_home_widgets(self, event=None):
         if not hasattr(self, 'home_widgets') or not self.home_widgets:
             return
-        w = self.root.winfo_width()
-        h = self.root.winfo_height()
-        y = h // 2 - 180
+        w = self.root.winfo_width() if self.root.winfo_width() > 1 else 800
+        h = self.root.winfo_height() if self.root.winfo_height() > 1 else 600
+        y = h // 2 - 210
         spacing = 70
         self.home_widgets[0].place(x=w//2, y=y, anchor="center")
         self.home_widgets[1].place(x=w//2, y=y+spacing*1, anchor="center")
@@ -300,24 +3106,28 @@ class BookTrackerApp:
         self.home_widgets[3].place(x=w//2, y=y+spacing*3, anchor="center")
         self.home_widgets[4].place(x=w//2, y=y+spacing*4, anchor="center")
         self.home_widgets[5].place(x=w//2, y=y+spacing*5, anchor="center")
+        self.home_widgets[6].place(x=w//2, y=y+spacing*6, anchor="center")
 
     # Show the form to add a new book.
     # Why: Lets the user input details for a new book and add it to their collection.
     def add_book_gui(self, collection):
-        self.clear_widgets()
-        self.add_widgets = []
+        self.screens.show(f"add:{collection}")
+
+    # Build the add-book form for one collection once.
+    def _build_add_screen(self, collection):
+        add_widgets = []
         
         # Place widgets directly on the background for a cleaner look
         title_label = tk.Label(self.root, text="Add a Book", font=("Helvetica", 22, "bold"), fg="#fff", bg="#000000", highlightthickness=2)
-        self.add_widgets.append(title_label)
+        add_widgets.append(title_label)
         label_title = tk.Label(self.root, text="Title:", font=("Helvetica", 14), fg="#fff", bg="#000000")
-        self.add_widgets.append(label_title)
+        add_widgets.append(label_title)
         title_entry = tk.Entry(self.root, font=("Helvetica", 14), bg="#222", fg="#fff", insertbackground="#fff")
-        self.add_widgets.append(title_entry)
+        add_widgets.append(title_entry)
         label_author = tk.Label(self.root, text="Author:", font=("Helvetica", 14), fg="#fff", bg="#000000")
-        self.add_widgets.append(label_author)
+        add_widgets.append(label_author)
         author_entry = tk.Entry(self.root, font=("Helvetica", 14), bg="#222", fg="#fff", insertbackground="#fff")
-        self.add_widgets.append(author_entry)
+        add_widgets.append(author_entry)
         
         def save_book():
             title = title_entry.get()
@@ -326,36 +3136,29 @@ class BookTrackerApp:
                 messagebox.showerror("Error", "Both title and author are required!")
                 return
             book = {"title": title, "author": author}
-            self.collection.add_book(collection, book)
+            if not self.collection.add_book(collection, book):
+                messagebox.showinfo("Info", f"'{title}' is already in {'My Books' if collection == 'my_books' else 'Wishlist'}.")
+                return
             messagebox.showinfo("Success", f"Book '{title}' added to {'My Books' if collection == 'my_books' else 'Wishlist'}!")
             self.show_home()
         
         save_btn = tk.Button(self.root, text="Save", command=save_book, font=("Helvetica", 14, "bold"), bg="#4CAF50", fg="white", width=12, height=1)
         back_btn = tk.Button(self.root, text="Back", command=self.show_home, font=("Helvetica", 14, "bold"), bg="#f44336", fg="white", width=12, height=1)
-        self.add_widgets.append(save_btn)
-        self.add_widgets.append(back_btn)
-        
-        # Place widgets using place for custom layout
-        w = self.root.winfo_width() if self.root.winfo_width() > 1 else 800
-        h = self.root.winfo_height() if self.root.winfo_height() > 1 else 600
-        y = h // 2 - 110
-        spacing = 50
-        title_label.place(x=w//2, y=y, anchor="center")
-        label_title.place(x=w//2, y=y+spacing*1, anchor="center")
-        title_entry.place(x=w//2, y=y+spacing*2, anchor="center", width=260)
-        label_author.place(x=w//2, y=y+spacing*3, anchor="center")
-        author_entry.place(x=w//2, y=y+spacing*4, anchor="center", width=260)
-        save_btn.place(x=w//2, y=y+spacing*5+10, anchor="center")
-        back_btn.place(x=w//2, y=y+spacing*6+10, anchor="center")
-        
-        self.current_widgets = self.add_widgets
-        self.root.update()
+        add_widgets.append(save_btn)
+        add_widgets.append(back_btn)
+        return add_widgets
+
+    # Start every visit to the add form with empty fields.
+    def _on_show_add_screen(self, collection):
+        self.add_widgets = self.screens.widgets(f"add:{collection}")
+        self.add_widgets[2].delete(0, tk.END)
+        self.add_widgets[4].delete(0, tk.END)
 
     def _reposition_add_widgets(self, event=None):
         if not hasattr(self, 'add_widgets') or not self.add_widgets:
             return
-        w = self.root.winfo_width()
-        h = self.root.winfo_height()
+        w = self.root.winfo_width() if self.root.winfo_width() > 1 else 800
+        h = self.root.winfo_height() if self.root.winfo_height() > 1 else 600
         y = h // 2 - 110
         spacing = 50
         self.add_widgets[0].place(x=w//2, y=y, anchor="center")
@@ -369,45 +3172,344 @@ class BookTrackerApp:
     # Show the list of books in either 'My Books' or 'Wishlist'.
     # Why: Displays the user's books or wishlist, allowing for management (delete, add to wishlist).
     def view_books_gui(self, collection):
-        self.clear_widgets()
+        self.screens.show(f"view:{collection}")
+
+    # Build the list screen for one collection once.
+    # Why: The VirtualBookList is kept between visits and updated through collection change events.
+    def _build_view_screen(self, collection):
         title = "My Books" if collection == "my_books" else "Wishlist"
         title_label = tk.Label(self.root, text=title, font=("Helvetica", 16, "bold"), fg="#fff", bg="#000")
-        title_label.place(relx=0.5, rely=0.1, anchor="center")
         books = self.collection.my_books if collection == "my_books" else self.collection.wishlist
-        if not books:
-            tk.Label(self.root, text="No books found.", font=("Helvetica", 12), fg="#fff", bg="#000").place(relx=0.5, rely=0.2, anchor="center")
+        def delete_callback(book_id):
+            book = self.collection.get(book_id)
+            if book is None:
+                return
+            if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete '{book['title']}'?"):
+                if self.collection.get(book_id) is not None:  # Still there after the dialog
+                    self.collection.delete(book_id)
+        def add_to_wishlist_callback(book_id):
+            book_to_add = self.collection.get(book_id)
+            if book_to_add is None:
+                return
+            if self.collection.contains("wishlist", book_to_add['title'], book_to_add['author']):
+                messagebox.showinfo("Info", f"'{book_to_add['title']}' is already in your Wishlist.")
+            else:
+                self.collection.add_book("wishlist", {"title": book_to_add['title'], "author": book_to_add['author']})
+                messagebox.showinfo("Success", f"'{book_to_add['title']}' added to Wishlist!")
+        # Cycle the book through To Read -> Reading -> Read.
+        def status_callback(book_id):
+            book = self.collection.get(book_id)
+            if book is None:
+                return
+            position = BOOK_STATUSES.index(book.status) if book.status in BOOK_STATUSES else -1
+            self.collection.update_status(book_id, BOOK_STATUSES[(position + 1) % len(BOOK_STATUSES)])
+        def move_to_my_books_callback(book_id):
+            book = self.collection.get(book_id)
+            if book is None:
+                return
+            if self.collection.move(book_id, "my_books"):
+                messagebox.showinfo("Success", f"'{book['title']}' moved to My Books!")
+            else:
+                messagebox.showinfo("Info", f"'{book['title']}' is already in My Books.")
+        if collection == "my_books":
+            actions = [("Next Status", "#FF9800", status_callback), ("Delete", "#f44336", delete_callback),
+                       ("Add to Wishlist", "#2196F3", add_to_wishlist_callback)]
         else:
-            for i, book in enumerate(books):
-                status = book.get("status", "N/A")
-                book_text = f"{i+1}. {book['title']} by {book['author']} (Status: {status})"
-                tk.Label(self.root, text=book_text, font=("Helvetica", 12), fg="#fff", bg="#000").place(relx=0.5, rely=0.2 + i*0.07, anchor="center")
-                def delete_callback(idx=i):
-                    if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete '{books[idx]['title']}'?"):
-                        self.collection.delete_book(collection, idx)
-                        self.view_books_gui(collection)
-                tk.Button(self.root, text="Delete", command=lambda idx=i: delete_callback(idx), font=("Helvetica", 10), bg="#f44336", fg="white").place(relx=0.7, rely=0.2 + i*0.07, anchor="center")
-                if collection == "my_books":
-                    def add_to_wishlist_callback(idx=i):
-                        book_to_add = self.collection.my_books[idx]
-                        if any(b['title'] == book_to_add['title'] and b['author'] == book_to_add['author'] for b in self.collection.wishlist):
-                            messagebox.showinfo("Info", f"'{book_to_add['title']}' is already in your Wishlist.")
-                        else:
-                            self.collection.add_book("wishlist", {"title": book_to_add['title'], "author": book_to_add['author']})
-                            messagebox.showinfo("Success", f"'{book_to_add['title']}' added to Wishlist!")
-                    tk.Button(self.root, text="Add to Wishlist", command=lambda idx=i: add_to_wishlist_callback(idx), font=("Helvetica", 10), bg="#2196F3", fg="white").place(relx=0.85, rely=0.2 + i*0.07, anchor="center")
+            actions = [("Delete", "#f44336", delete_callback), ("Move to My Books", "#4CAF50", move_to_my_books_callback)]
+        book_list = VirtualBookList(self.root, books, actions)
+        self.book_lists[collection] = book_list
         back_btn = tk.Button(self.root, text="Back", command=self.show_home, font=("Helvetica", 12), bg="#f44336", fg="white", width=10)
+        import_btn = tk.Button(self.root, text="Import...", command=lambda: self.import_books_gui(collection), font=("Helvetica", 12), bg="#2196F3", fg="white", width=10)
+        export_btn = tk.Button(self.root, text="Export...", command=lambda: self.export_books_gui(collection), font=("Helvetica", 12), bg="#2196F3", fg="white", width=10)
+        progress = ttk.Progressbar(self.root, orient="horizontal", mode="determinate", maximum=100)
+        query = tk.StringVar(self.root)
+        search_entry = tk.Entry(self.root, textvariable=query, font=("Helvetica", 12), bg="#222", fg="#fff", insertbackground="#fff")
+        query.trace_add("write", lambda *args: self._schedule_search(collection, query.get()))
+        sort_menu = self._view_mode_menu(collection, 0, {"Sort: Added": "added", "Sort: Title": "title", "Sort: Author": "author"})
+        filter_options = {"Show: All": None}
+        filter_options.update((f"Show: {status}", status) for status in BOOK_STATUSES)
+        filter_options["Show: No status"] = ""
+        filter_menu = self._view_mode_menu(collection, 1, filter_options)
+        return [title_label, book_list.frame, back_btn, import_btn, export_btn, progress, search_entry, sort_menu, filter_menu]
+
+    # Build a drop-down that sets one part (0 = sort order, 1 = status filter) of a list's view mode.
+    # options maps each label to its value; the first one is the default.
+    def _view_mode_menu(self, collection, part, options):
+        labels = list(options)
+        choice = tk.StringVar(self.root, value=labels[0])
+        def choose(label):
+            mode = list(self._view_modes.get(collection, DEFAULT_VIEW_MODE))
+            mode[part] = options[label]
+            self._view_modes[collection] = tuple(mode)
+            self._run_search(collection)
+        menu = tk.OptionMenu(self.root, choice, *labels, command=choose)
+        menu.config(font=("Helvetica", 11), bg="#222", fg="#fff", activebackground="#444", activeforeground="#fff", highlightthickness=0)
+        return menu
+
+    def _reposition_view_widgets(self, collection):
+        title_label, list_frame, back_btn, import_btn, export_btn, progress, search_entry, sort_menu, filter_menu = self.screens.widgets(f"view:{collection}")
+        title_label.place(relx=0.5, rely=0.06, anchor="center")
+        search_entry.place(relx=0.5, rely=0.12, anchor="center", width=320)
+        sort_menu.place(relx=0.19, rely=0.12, anchor="center")
+        filter_menu.place(relx=0.81, rely=0.12, anchor="center")
+        list_frame.place(relx=0.5, rely=0.17, relwidth=0.9, relheight=0.63, anchor="n")
+        import_btn.place(relx=0.3, rely=0.9, anchor="center")
         back_btn.place(relx=0.5, rely=0.9, anchor="center")
+        export_btn.place(relx=0.7, rely=0.9, anchor="center")
+        if self._bulk_job is not None:
+            progress.place(relx=0.5, rely=0.83, relwidth=0.5, anchor="center")
+
+    # Ask for a CSV/JSONL file and import it into the collection without freezing the window.
+    # Why: The import runs one chunk per event-loop turn, updating the progress bar in between.
+    def import_books_gui(self, collection):
+        path = filedialog.askopenfilename(title="Import Books", filetypes=[("Book files", "*.csv *.jsonl"), ("CSV", "*.csv"), ("JSON Lines", "*.jsonl")])
+        if not path:
+            return
+        steps = ((done, size, added) for added, done, size in iter_import_books(self.collection, path, collection))
+        self._run_bulk_job(collection, steps, lambda count: f"Imported {count} books into {'My Books' if collection == 'my_books' else 'Wishlist'}.")
+
+    # Ask where to save and export the collection to CSV/JSONL in chunks.
+    def export_books_gui(self, collection):
+        path = filedialog.asksaveasfilename(title="Export Books", defaultextension=".csv", filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl")])
+        if not path:
+            return
+        steps = ((written, total, written) for written, total in iter_export_books(self.collection, path, collection))
+        self._run_bulk_job(collection, steps, lambda count: f"Exported {count} books to {path}.")
+
+    # Drive an import/export generator one chunk at a time from the Tk event loop.
+    # steps yields (done, total, books handled so far); done_message(count) builds the final message.
+    def _run_bulk_job(self, collection, steps, done_message):
+        if self._bulk_job is not None:
+            messagebox.showinfo("Info", "An import or export is already running.")
+            return
+        widgets = self.screens.widgets(f"view:{collection}")
+        progress = widgets[5]
+        self._bulk_job = steps
+        for button in widgets[3:5]:
+            button.config(state="disabled")
+        progress["value"] = 0
+        progress.place(relx=0.5, rely=0.83, relwidth=0.5, anchor="center")
+
+        count = 0
+
+        def finish(error=None):
+            self._bulk_job = None
+            progress.place_forget()
+            for button in widgets[3:5]:
+                button.config(state="normal")
+            if error is not None:
+                messagebox.showerror("Error", str(error))
+            else:
+                messagebox.showinfo("Success", done_message(count))
+
+        def step():
+            nonlocal count
+            if self._bulk_job is not steps:
+                return  # Abandoned at logout
+            try:
+                done, total, count = next(steps)
+            except StopIteration:
+                finish()
+                return
+            except Exception as e:  # Any failure must end the job, or Import/Export stay disabled
+                finish(e)
+                return
+            progress["value"] = 100 * done / total if total else 100
+            self.root.after(1, step)
+
+        self.root.after(1, step)
+
+    # Run the search a moment after the user stops typing.
+    # Why: Debouncing keeps fast typing from running a query per keystroke.
+    def _schedule_search(self, collection, query):
+        self._search_queries[collection] = query
+        if self._search_after_ids.get(collection):
+            self.root.after_cancel(self._search_after_ids[collection])
+        self._search_after_ids[collection] = self.root.after(150, lambda: self._run_search(collection))
+
+    # Show the search results for a collection's list, or the whole collection if the box is empty,
+    # in the list's chosen order and filtered to its chosen status.
+    # Why: Without a query the sorted/filtered view comes straight from the collection's indexes.
+    # Search results (at most 500) are filtered and sorted here, and keep their relevance order
+    # unless sorted by title or author.
+    def _run_search(self, collection):
+        self._search_after_ids[collection] = None
+        book_list = self.book_lists.get(collection)
+        if book_list is None:
+            return
+        order, status = self._view_modes.get(collection, DEFAULT_VIEW_MODE)
+        query = self._search_queries.get(collection, "").strip()
+        if query:
+            books = [book for _, book in self.collection.search(query, collection, limit=500)]
+            if status is not None:
+                books = [book for book in books if (book.status or "") == status]
+            if order != "added":
+                books.sort(key=SORT_KEYS[order])
+            book_list.books = books
+        else:
+            book_list.books = self.collection.books(collection, order, status)
+        book_list.scroll_to(0)
+
+    # Forward collection changes to the matching list as targeted row updates.
+    # Why: A delete or add only touches the visible rows instead of rebuilding the screen.
+    def _on_collection_change(self, event, collection, index, book):
+        if self.screens.current == "home":
+            self._refresh_home_stats()
+        if event == "reload" and collection is None:
+            for book_list in self.book_lists.values():
+                book_list.refresh()
+            return
+        book_list = self.book_lists.get(collection)
+        if book_list is None:
+            return
+        if self._search_queries.get(collection, "").strip():
+            self._schedule_search(collection, self._search_queries[collection])  # Results may have changed
+            return
+        if self._view_modes.get(collection, DEFAULT_VIEW_MODE) != DEFAULT_VIEW_MODE:
+            index = None  # Positions in a sorted or filtered list aren't known; rebind the visible rows
+        if event == "insert":
+            book_list.on_insert(index)
+        elif event == "remove":
+            book_list.on_remove(index)
+        elif event == "update":
+            book_list.on_update(index)
+        else:
+            book_list.refresh()
 
     # Log out of the app and return to the login screen.
     # Why: Allows the user to end their session and return to the login screen for security or switching users.
+    # The student's shard is flushed and closed, and every screen holding their books is dropped,
+    # so nothing of theirs stays in memory for the next student on a shared machine.
     def logout(self):
+        self._release_collection()
         self.show_login_screen()
 
-# Start the application by showing the login screen in the same window
+    # Flush and close the logged-in student's collection and forget everything built from it.
+    def _release_collection(self):
+        if self._bulk_job is not None:
+            self._bulk_job.close()  # An unfinished export removes its temporary file
+            self._bulk_job = None
+        for after_id in self._search_after_ids.values():
+            if after_id:
+                self.root.after_cancel(after_id)
+        self._search_after_ids = {}
+        self._search_queries = {}
+        self._view_modes = {}
+        for collection in ("my_books", "wishlist"):
+            self.screens.discard(f"view:{collection}")
+        self.book_lists = {}
+        self._login_pending = False
+        book_collection, self.collection, self.student_id = self.collection, None, None
+        if book_collection is None:
+            return
+        book_collection.unsubscribe(self._on_collection_change)
+        try:
+            book_collection.close()
+        except Exception as e:
+            messagebox.showerror("Save Error", f"Could not save your books: {e}")
+
+# Print a one-line progress indicator for the headless import/export commands.
+def _print_progress(done, total):
+    percent = 100 * done // total if total else 100
+    print(f"\r{percent:3d}%", end="", file=sys.stderr, flush=True)
+
+# Entry point: with no command, start the GUI; "import"/"export" work on the book file headlessly.
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cozy Book Tracker")
+    parser.add_argument("--storage", choices=["json", "sqlite"], default="json", help="storage backend to use")
+    parser.add_argument("--startup-timing", action="store_true", help="print how long startup took")
+    parser.add_argument("--startup-log", metavar="FILE", help="append startup timings to FILE as JSON lines")
+    parser.add_argument("--instrument", action="store_true", default=bool(os.environ.get("BOOKTRACKER_INSTRUMENT", "").strip("0")),
+                        help="time storage, screen, resize and Tk callback spans and print a histogram on exit "
+                             "(or set BOOKTRACKER_INSTRUMENT=1)")
+    parser.add_argument("--trace", metavar="FILE", default=os.environ.get("BOOKTRACKER_TRACE"),
+                        help="also write the spans to FILE in Chrome trace format (or set BOOKTRACKER_TRACE)")
+    parser.add_argument("--profile-screen", metavar="SCREEN", default=os.environ.get("BOOKTRACKER_PROFILE_SCREEN"),
+                        help="run the first show of SCREEN (login, home, add:my_books, view:wishlist, ...) under cProfile "
+                             "(or set BOOKTRACKER_PROFILE_SCREEN)")
+    parser.add_argument("--shard-root", metavar="DIR", default=SHARD_ROOT, help="directory holding the per-student shards")
+    commands = parser.add_subparsers(dest="command")
+    for name, help_text in (("import", "import books from a CSV or JSONL file"), ("export", "export books to a CSV or JSONL file")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("file")
+        command.add_argument("--collection", choices=["my_books", "wishlist"], default="my_books")
+        command.add_argument("--format", choices=["csv", "jsonl"], help="file format (default: from the file extension)")
+        # Required: the app only reads per-student shards, so books in the shared books.json are never shown
+        command.add_argument("--student", metavar="ID", required=True, help="student whose shard to use")
+    command = commands.add_parser("shard", help="copy a shared books.json into per-student shards")
+    command.add_argument("students", nargs="*", metavar="STUDENT_ID")
+    command.add_argument("--students-file", metavar="FILE", help="file with one STUDENT ID per line")
+    command.add_argument("--source", default="books.json", help="shared book file to split (default: books.json)")
+    args = parser.parse_args(argv)
+    if args.instrument or args.trace:
+        instrumentation.enable(trace_path=args.trace)
+    if args.profile_screen:
+        instrumentation.profile_screen(args.profile_screen)
+    try:
+        return _run_command(args)
+    finally:
+        instrumentation.close()
+
+# Start the GUI, or run the import/export command, once main() has set up instrumentation.
+def _run_command(args):
+    if args.command is None:
+        # Start the application by showing the login screen in the same window
+        timer = StartupTimer()
+        root = tk.Tk()
+        timer.mark("window")
+        app = BookTrackerApp(root, storage=args.storage, startup_timer=timer, report_startup=args.startup_timing or bool(args.startup_log),
+                             startup_log=args.startup_log, shard_root=args.shard_root)
+        root.mainloop()
+        if app.collection is not None:
+            app.collection.close()  # In case the loop was left through root.quit without exit_app
+        return 0
+
+    if args.command == "shard":
+        return _split_command(args)
+
+    try:
+        book_collection = open_student_collection(args.student, args.storage, args.shard_root)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    try:
+        if args.command == "import":
+            count = import_books(book_collection, args.file, args.collection, args.format, _print_progress)
+            print(f"\nImported {count} books into {args.collection}.", file=sys.stderr)
+        else:
+            count = export_books(book_collection, args.file, args.collection, args.format, _print_progress)
+            print(f"\nExported {count} books from {args.collection}.", file=sys.stderr)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"\nError: {e}", file=sys.stderr)
+        return 1
+    finally:
+        book_collection.close()
+    return 0
+
+# The "shard" command: seed each listed student's shard from the shared book file.
+def _split_command(args):
+    student_ids = list(args.students)
+    try:
+        if args.students_file:
+            with open(args.students_file, "r", encoding="utf-8") as file:
+                student_ids.extend(line.strip() for line in file if line.strip())
+        if not student_ids:
+            print("Error: no STUDENT IDs given", file=sys.stderr)
+            return 1
+        for student_id in student_ids:
+            student_shard_dir(student_id, args.shard_root)  # Reject bad IDs before copying anything
+        copied = split_into_shards(student_ids, args.source, args.shard_root, args.storage, _print_progress)
+    except (OSError, ValueError) as e:
+        print(f"\nError: {e}", file=sys.stderr)
+        return 1
+    skipped = sorted(student_id for student_id, count in copied.items() if count is None)
+    print(f"\nCreated {len(copied) - len(skipped)} shards under {args.shard_root}.", file=sys.stderr)
+    if skipped:
+        print(f"Skipped {len(skipped)} students who already have a shard: {', '.join(skipped)}", file=sys.stderr)
+    return 0
+
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = BookTrackerApp(root)
-    root.mainloop()
+    sys.exit(main())
 
 
 
@@ -0,0 +1,139 @@
+# Tests for the storage backends: journal compaction, write-behind, crash recovery and ids.
+# Run from this directory with: python -m pytest test_storage.py (or python -m unittest test_storage)
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import main as app
+
+def _titles(books):
+    return [book.title for book in books]
+
+class StorageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="booktracker-test-")
+        self.filename = os.path.join(self.directory, "books.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    # Open the JSON file in journal mode, as the app does.
+    def open_json(self, **options):
+        return app.BookCollection(self.filename, journal=True, **options)
+
+class CompactionTest(StorageTestCase):
+    # A save() while the journal is being compacted must not be overwritten by the compactor's
+    # older snapshot, and neither may lose a change.
+    def test_save_during_compaction(self):
+        backend = app.JsonFileBackend(self.filename, journal=True, compact_threshold=2048)
+        backend.load()
+        write_atomic = app._write_atomic
+        compacting = threading.Event()
+        release = threading.Event()
+
+        # Hold the compactor inside its snapshot write until the main thread has saved.
+        def slow_write(*args, **kwargs):
+            if threading.current_thread() is not threading.main_thread():
+                compacting.set()
+                release.wait(5)
+            return write_atomic(*args, **kwargs)
+
+        with mock.patch.object(app, "_write_atomic", slow_write):
+            number = 0
+            while not compacting.is_set():
+                backend.add("my_books", app.Book(f"Book {number}", "Author"))
+                number += 1
+                self.assertLess(number, 1000, "journal never compacted")
+            backend.add("wishlist", app.Book("Added while compacting", "Author"))
+            saver = threading.Thread(target=backend.save)
+            saver.start()
+            time.sleep(0.05)
+            release.set()
+            saver.join(5)
+            self.assertFalse(saver.is_alive())
+        backend.close()
+
+        reopened = app.JsonFileBackend(self.filename, journal=True)
+        reopened.load()
+        self.assertEqual(_titles(reopened.page("my_books", 0, number)), [f"Book {i}" for i in range(number)])
+        self.assertEqual(_titles(reopened.page("wishlist", 0, 10)), ["Added while compacting"])
+        self.assertEqual(os.path.getsize(self.filename + ".journal"), 0)
+        reopened.close()
+
+class WriteBehindTest(StorageTestCase):
+    # load_data() writes the queued changes before reloading, instead of dropping them and
+    # handing their ids out again.
+    def test_load_data_keeps_pending_changes(self):
+        collection = self.open_json(write_behind=True, flush_interval=60, flush_after=1000)
+        collection.add_book("my_books", {"title": "Queued", "author": "Author"})
+        queued = collection.my_books[0].id
+        collection.load_data()
+        self.assertEqual(_titles(collection.my_books), ["Queued"])
+        collection.add_book("my_books", {"title": "After reload", "author": "Author"})
+        self.assertNotEqual(collection.my_books[1].id, queued)
+        collection.close()
+
+        reopened = self.open_json()
+        self.assertEqual(_titles(reopened.my_books), ["Queued", "After reload"])
+        reopened.close()
+
+class JournalRecoveryTest(StorageTestCase):
+    # A crash in the middle of an append leaves a torn last line: it is ignored on load and cut
+    # off, so the next record starts on a line of its own.
+    def test_torn_journal_tail(self):
+        collection = self.open_json()
+        for title in ("One", "Two", "Three"):
+            collection.add_book("my_books", {"title": title, "author": "Author"})
+        collection.close()
+        with open(self.filename + ".journal", "ab") as file:
+            file.write(b'{"op": "add", "collection": "my_books", "book": {"title": "Tor')
+
+        collection = self.open_json()
+        self.assertEqual(_titles(collection.my_books), ["One", "Two", "Three"])
+        collection.add_book("my_books", {"title": "Four", "author": "Author"})
+        collection.close()
+
+        reopened = self.open_json()
+        self.assertEqual(_titles(reopened.my_books), ["One", "Two", "Three", "Four"])
+        reopened.close()
+
+class ContinuityTest(StorageTestCase):
+    # Ids are never reused, even for the newest book after it is deleted and the file reopened,
+    # and journal records written after a reopen are replayed on top of the snapshot.
+    def check_ids_across_reopen(self, open_collection):
+        collection = open_collection()
+        for title in ("One", "Two", "Three"):
+            collection.add_book("my_books", {"title": title, "author": "Author"})
+        ids = [book.id for book in collection.my_books]
+        collection.delete(ids[-1])
+        collection.close()
+
+        collection = open_collection()
+        collection.add_book("my_books", {"title": "Four", "author": "Author"})
+        new_id = collection.my_books[-1].id
+        self.assertGreater(new_id, max(ids))
+        collection.save_data()
+        collection.add_book("wishlist", {"title": "Five", "author": "Author"})
+        collection.close()
+
+        reopened = open_collection()
+        self.assertEqual(_titles(reopened.my_books), ["One", "Two", "Four"])
+        self.assertEqual(_titles(reopened.wishlist), ["Five"])
+        self.assertEqual([book.id for book in reopened.my_books], ids[:2] + [new_id])
+        self.assertGreater(reopened.wishlist[0].id, new_id)
+        reopened.close()
+
+    def test_json_ids_and_seq_across_reopen(self):
+        self.check_ids_across_reopen(self.open_json)
+
+    def test_sqlite_ids_across_reopen(self):
+        filename = os.path.join(self.directory, "books.db")
+        self.check_ids_across_reopen(lambda: app.BookCollection(backend=app.SqliteBackend(filename)))
+
+if __name__ == "__main__":
+    unittest.main()